@@ -68,6 +68,12 @@ if namespace is None:
 
 app.config['REDIS_HOST'] = 'redis-master.' + namespace
 
+# Setup the task queue workers
+for name in ['TASK_WORKERS','TASK_INTERVAL','TASK_TIMEOUT','TRACK_MIN_DELAY','TRACK_MAX_DELAY']:
+   value = os.environ.get(name)
+   if value is not None:
+      app.config[name] = int(value)
+
 # Start the task queue
 start_task_queue(app)
 
@@ -1,10 +1,10 @@
-from .client import Client,ServiceError,parse_args,make_client
-from .webhdfs import WebHDFS
+from .client import Client,ServiceError,SessionPool,parse_args,make_client
+from .webhdfs import WebHDFS,FileStatus,DirectoryListing,MetadataCache
 from .oozie import Oozie,Job,Workflow,InvalidWorkflow
 from .cluster import ClusterInformation
 __all__ = [
-   'Client','ServiceError','parse_args','make_client',
-   'WebHDFS',
-   'Oozie','Job','Workflow','InvalidWorkflow'
+   'Client','ServiceError','SessionPool','parse_args','make_client',
+   'WebHDFS','FileStatus','DirectoryListing','MetadataCache',
+   'Oozie','Job','Workflow','InvalidWorkflow',
    'ClusterInformation']
 __version__ = '0.11'
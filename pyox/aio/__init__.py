@@ -0,0 +1,10 @@
+from .client import Client
+from .webhdfs import WebHDFS
+from .oozie import Oozie
+from .cluster import ClusterInformation
+from pyox.client import ServiceError
+__all__ = [
+   'Client','ServiceError',
+   'WebHDFS',
+   'Oozie',
+   'ClusterInformation']
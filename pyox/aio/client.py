@@ -0,0 +1,127 @@
+import asyncio
+import httpx
+import logging
+
+from pyox.client import Client as _Client, ServiceError
+
+def verbose_log(function):
+   async def wrapper(self,*args,**kwargs):
+      r = await function(self,*args,**kwargs)
+      if self.verbose:
+         logger = logging.getLogger(__name__)
+         for key in r.request.headers:
+            value = r.request.headers[key]
+            logger.debug('{}: {}'.format(key,value))
+
+      return r
+   return wrapper
+
+async def async_content(data,chunk_size=65536):
+   """Adapts a file-like object or an iterable to an async iterator of bytes.
+
+   A file-like object is read in the default executor so that the event loop is
+   not blocked; an iterable is iterated on the event loop and so should not block
+   (e.g., a list of bytes).
+   """
+   if hasattr(data,'read'):
+      loop = asyncio.get_running_loop()
+      while True:
+         chunk = await loop.run_in_executor(None,data.read,chunk_size)
+         if not chunk:
+            break
+         yield chunk.encode('utf-8') if isinstance(chunk,str) else chunk
+   else:
+      for chunk in data:
+         yield chunk.encode('utf-8') if isinstance(chunk,str) else chunk
+
+class Client(_Client):
+   """An asyncio client that builds URLs and authentication like pyox.client.Client.
+
+   The requests go through a shared httpx.AsyncClient that is created on first use
+   (so that proxies and verify can be set after construction). A client can be used
+   as an async context manager to close it. An httpx.AsyncClient that is given to
+   the client is shared and is not closed by it.
+   """
+
+   def __init__(self,http_client=None,max_connections=100,**kwargs):
+      super().__init__(**kwargs)
+      self.http_client = http_client
+      self.owns_http_client = http_client is None
+      self.max_connections = max_connections
+
+   def http(self):
+      if self.http_client is None:
+         mounts = None
+         if self.proxies is not None:
+            mounts = {}
+            for protocol,url in self.proxies.items():
+               mounts[protocol+'://'] = httpx.AsyncHTTPTransport(proxy=url,verify=self.verify)
+         self.http_client = httpx.AsyncClient(
+            verify=self.verify,
+            mounts=mounts,
+            timeout=None,
+            limits=httpx.Limits(max_connections=self.max_connections,max_keepalive_connections=self.max_connections))
+         self.owns_http_client = True
+      return self.http_client
+
+   async def aclose(self):
+      if self.http_client is not None:
+         if self.owns_http_client:
+            await self.http_client.aclose()
+         self.http_client = None
+
+   async def __aenter__(self):
+      return self
+
+   async def __aexit__(self,exc_type,exc_value,traceback):
+      await self.aclose()
+
+   def auth(self):
+      if self.bearer_auth is None:
+         if self.negotiate:
+            raise ValueError('HTTP Negotiate authentication is not supported by the asyncio clients')
+         return httpx.BasicAuth(self.username,self.password if self.password is not None else '') if self.username is not None else None
+      else:
+         return None
+
+   async def request(self,method,url,params={},data=None,headers=None,allow_redirects=True,stream=False):
+      http = self.http()
+      content = None
+      if isinstance(data,str):
+         content = data.encode('utf-8')
+      elif isinstance(data,bytes) or hasattr(data,'__aiter__'):
+         content = data
+      elif isinstance(data,(bytearray,memoryview)):
+         content = bytes(data)
+      elif data is not None:
+         content = async_content(data)
+      req = http.build_request(
+         method,
+         url,
+         params=params if params else None,
+         content=content,
+         headers=self.request_headers(headers),
+         cookies=self.cookies)
+      return await http.send(req,auth=self.auth(),follow_redirects=allow_redirects,stream=stream)
+
+   @verbose_log
+   async def post(self,url,params={},data=None,headers=None,allow_redirects=True):
+      return await self.request('POST',url,params=params,data=data,headers=headers,allow_redirects=allow_redirects)
+
+   @verbose_log
+   async def put(self,url,params={},data=None,headers=None,allow_redirects=True):
+      return await self.request('PUT',url,params=params,data=data,headers=headers,allow_redirects=allow_redirects)
+
+   @verbose_log
+   async def get(self,url,params={},allow_redirects=True,stream=False):
+      return await self.request('GET',url,params=params,allow_redirects=allow_redirects,stream=stream)
+
+   @verbose_log
+   async def delete(self,url,params={},allow_redirects=True):
+      return await self.request('DELETE',url,params=params,allow_redirects=allow_redirects)
+
+async def service_error(status_code,message,response):
+   """Reads a (possibly streamed) response so it can be reported by a ServiceError."""
+   await response.aread()
+   await response.aclose()
+   return ServiceError(status_code,message,response)
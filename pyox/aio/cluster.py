@@ -0,0 +1,29 @@
+from pyox.aio.client import Client, ServiceError
+from pyox.client import response_data
+
+class ClusterInformation(Client):
+
+   def __init__(self,**kwargs):
+      super().__init__(**kwargs)
+      self.service='resourcemanager'
+
+   async def info(self):
+      url = '{}/cluster/info'.format(self.service_url())
+      req = await self.get(url)
+      if req.status_code!=200:
+         raise ServiceError(req.status_code,'Cannot get cluster information',request=req)
+      return response_data(req)['clusterInfo']
+
+   async def metrics(self):
+      url = '{}/cluster/metrics'.format(self.service_url())
+      req = await self.get(url)
+      if req.status_code!=200:
+         raise ServiceError(req.status_code,'Cannot get cluster information',request=req)
+      return response_data(req)['clusterMetrics']
+
+   async def scheduler(self):
+      url = '{}/cluster/scheduler'.format(self.service_url())
+      req = await self.get(url)
+      if req.status_code!=200:
+         raise ServiceError(req.status_code,'Cannot get cluster information',request=req)
+      return response_data(req)['scheduler']['schedulerInfo']
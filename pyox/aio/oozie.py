@@ -0,0 +1,81 @@
+from pyox.aio.client import Client, ServiceError
+from pyox.aio.webhdfs import WebHDFS
+from pyox.client import response_data
+from pyox.oozie import JOB_TRACKER
+import asyncio
+
+class Oozie(Client):
+   """An asyncio Oozie client for starting jobs and checking their status.
+
+   Jobs are started from a configuration (see pyox.oozie.Job for building one);
+   workflow submission with resource copying remains in pyox.oozie.Oozie.
+   """
+
+   def __init__(self,**kwargs):
+      super().__init__(**kwargs)
+      self.service = 'oozie'
+      self.properties = {}
+      self.defaultNamenode = kwargs.get('namenode')
+      if self.defaultNamenode is None:
+         self.defaultNamenode = 'sandbox'
+      tracker = kwargs.get('tracker')
+      if tracker is not None:
+         self.properties[JOB_TRACKER] = tracker
+
+   def createHDFSClient(self):
+      # the connection pool is shared and stays open when the WebHDFS client is closed
+      webhdfs = WebHDFS(base=self.base,secure=self.secure,host=self.host,port=self.port,gateway=self.gateway,username=self.username,password=self.password,cookies=self.cookies,http_client=self.http())
+      webhdfs.bearer_auth = self.bearer_auth
+      webhdfs.proxies = self.proxies
+      webhdfs.verify = self.verify
+      if self.verbose:
+         webhdfs.enable_verbose()
+      return webhdfs
+
+   async def start(self,xml):
+      headers = {'Content-Type' : 'application/xml; charset=UTF-8'}
+      url = '{}/jobs'.format(self.service_url())
+      req = await self.post(url,params={'action':'start'},data=xml,headers=headers)
+      if req.status_code==201:
+         msg = req.json()
+         return msg['id']
+      else:
+         raise ServiceError(req.status_code,'Cannot start job.',request=req)
+
+   async def status(self,jobid,show='info'):
+      url = '{}/job/{}'.format(self.service_url(version='v2'),jobid)
+      req = await self.get(url,params={'show':show})
+      if req.status_code==200:
+         return response_data(req)
+      else:
+         raise ServiceError(req.status_code if req.status_code!=400 else 404,'Cannot get job information for {}'.format(jobid),request=req)
+
+   async def status_many(self,jobids,show='info',max_concurrency=100):
+      """Retrieves the status of many jobs concurrently.
+
+      Yields a (jobid,info,error) tuple for every job as the responses arrive.
+      A failure for one job is reported as its error and does not stop the others.
+      """
+      semaphore = asyncio.Semaphore(max_concurrency)
+      async def fetch(jobid):
+         async with semaphore:
+            try:
+               return (jobid,await self.status(jobid,show=show),None)
+            except Exception as err:
+               return (jobid,None,err)
+      for result in asyncio.as_completed([fetch(jobid) for jobid in jobids]):
+         yield await result
+
+   async def list_jobs(self,status=None,offset=0,count=50):
+      url = '{}/jobs'.format(self.service_url(version='v2'))
+      params = {
+         'offset' : str(offset),
+         'len' : str(count)
+      }
+      if status is not None:
+         params['filter'] = 'status='+str(status)
+      req = await self.get(url,params=params)
+      if req.status_code==200:
+         return response_data(req)
+      else:
+         raise ServiceError(req.status_code,'Cannot list jobs',request=req)
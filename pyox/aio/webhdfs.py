@@ -0,0 +1,146 @@
+from pyox.aio.client import Client, ServiceError, service_error
+from pyox.webhdfs import absolute_path, FileStatus, DirectoryListing
+
+class WebHDFS(Client):
+
+   def __init__(self,**kwargs):
+      super().__init__(**kwargs)
+      self.service = 'webhdfs'
+      self.read_chunk_size = 65536
+
+   async def list_directory(self,path):
+      path = absolute_path(path)
+      url = '{}{}'.format(self.service_url(),path)
+      req = await self.get(url,params={'op':'LISTSTATUS'},allow_redirects=False)
+      if req.status_code==200:
+         data = req.json()
+         return DirectoryListing(FileStatus.from_json(entry) for entry in data['FileStatuses']['FileStatus'])
+      else:
+         raise ServiceError(req.status_code,'Cannot access path {}'.format(path),req)
+
+   async def open(self,path,offset=None,length=None,buffersize=None):
+      """Opens a file and returns an async iterator over its content."""
+      path = absolute_path(path)
+      url = '{}{}'.format(self.service_url(),path)
+      params = {'op':'OPEN'}
+      if offset is not None:
+         params['offset'] = offset
+      if length is not None:
+         params['length'] = length
+      if buffersize is not None:
+         params['buffersize'] = buffersize
+      open_req = await self.get(url,params=params,allow_redirects=False)
+      if open_req.status_code==307:
+         location = open_req.headers['Location']
+         read_req = await self.get(location,allow_redirects=False,stream=True)
+         if read_req.status_code==200:
+            async def content():
+               try:
+                  async for chunk in read_req.aiter_bytes(chunk_size=self.read_chunk_size):
+                     yield chunk
+               finally:
+                  await read_req.aclose()
+            return content()
+         else:
+            raise await service_error(read_req.status_code,'Cannot open datanode location {}'.format(location),read_req)
+      else:
+         raise ServiceError(open_req.status_code,'Cannot open path {}'.format(path),open_req)
+
+   async def make_directory(self,path,permission=None):
+      path = absolute_path(path)
+      url = '{}{}'.format(self.service_url(),path)
+      params = {'op':'MKDIRS'}
+      if permission is not None:
+         params['permission'] = permission
+      req = await self.put(url,params=params)
+      if req.status_code!=200:
+         raise ServiceError(req.status_code,'Cannot create path {}'.format(path),req)
+      msg = req.json()
+      return msg['boolean']
+
+   async def move(self,sourcepath,destpath):
+      sourcepath = absolute_path(sourcepath)
+      destpath = absolute_path(destpath)
+      url = '{}{}'.format(self.service_url(),sourcepath)
+      req = await self.put(url,params={'op':'RENAME','destination':destpath})
+      if req.status_code!=200:
+         raise ServiceError(req.status_code,'Cannot move path {} to {}'.format(sourcepath,destpath),req)
+      msg = req.json()
+      return msg['boolean']
+
+   async def remove(self,path,recursive=False):
+      path = absolute_path(path)
+      url = '{}{}'.format(self.service_url(),path)
+      req = await self.delete(url,params={'op':'DELETE','recursive':'true' if recursive else 'false'})
+      if req.status_code!=200:
+         raise ServiceError(req.status_code,'Cannot delete path {}'.format(path),req)
+      msg = req.json()
+      return msg['boolean']
+
+   async def status(self,path):
+      url = '{}{}'.format(self.service_url(),absolute_path(path))
+      req = await self.get(url,params={'op':'GETFILESTATUS'})
+      if req.status_code!=200:
+         raise ServiceError(req.status_code,'Cannot status path {}'.format(path),req)
+      msg = req.json()
+      return msg['FileStatus']
+
+   async def checksum(self,path):
+      url = '{}{}'.format(self.service_url(),absolute_path(path))
+      req = await self.get(url,params={'op':'GETFILECHECKSUM'})
+      if req.status_code!=200:
+         raise ServiceError(req.status_code,'Cannot get checksum of path {}'.format(path),req)
+      msg = req.json()
+      return msg['FileChecksum']
+
+   async def copy(self,data,path,size=-1,overwrite=False):
+      """Copies data (bytes, str or an async iterable of bytes) to a new file."""
+      path = absolute_path(path)
+      url = '{}{}'.format(self.service_url(),path)
+      headers = {}
+      headers['Content-Type'] = 'application/octet-stream'
+      if size >= 0:
+         headers['Content-Length'] = str(size)
+      open_req = await self.put(
+         url,
+         params={'op':'CREATE','overwrite':'true' if overwrite else 'false'},
+         allow_redirects=False,
+         headers={'Content-Length' : '0'})
+      if open_req.status_code==307:
+         location = open_req.headers['Location']
+         req = await self.put(
+            location,
+            data=data,
+            headers=headers)
+         if req.status_code!=201:
+            raise ServiceError(req.status_code,'Cannot copy to path {}'.format(path),req)
+      else:
+         raise ServiceError(open_req.status_code,'Cannot open path {}'.format(path),open_req)
+      return True
+
+   async def append(self,data,path,size=-1,buffersize=None):
+      path = absolute_path(path)
+      url = '{}{}'.format(self.service_url(),path)
+      params = {'op':'APPEND'}
+      if buffersize is not None:
+         params['buffersize'] = buffersize
+      open_req = await self.post(
+         url,
+         params=params,
+         allow_redirects=False,
+         headers={'Content-Length' : '0'})
+      if open_req.status_code==307:
+         headers = {}
+         headers['Content-Type'] = 'application/octet-stream'
+         if size >= 0:
+            headers['Content-Length'] = str(size)
+         location = open_req.headers['Location']
+         req = await self.post(
+            location,
+            data=data,
+            headers=headers)
+         if req.status_code!=200:
+            raise ServiceError(req.status_code,'Cannot append to path {}'.format(path),req)
+      else:
+         raise ServiceError(open_req.status_code,'Cannot append path {}'.format(path),open_req)
+      return True
@@ -5,12 +5,12 @@ import sys
 import traceback
 import logging
 from redis import Redis
-from time import sleep
+from time import sleep, time
 from uuid import uuid4
 from io import StringIO
 from datetime import datetime
 
-from pyox.apps.tracker.tasks import task_authenticate, task_create
+from pyox.apps.tracker.tasks import task_authenticate, task_create, task_index_job, task_for_job, task_schedule, task_wake
 
 from pyox import ServiceError, ClusterInformation, Oozie, Workflow
 
@@ -97,23 +97,56 @@ def application_ids(info):
       return []
 
 def set_property(redis,objid,propname,value):
-   redis.hset(objid,propname,value)
-   redis.expire(objid,REDIS_EXPIRES)
+   set_properties(redis,objid,{propname:value})
+
+def set_properties(redis,objid,properties):
+   pipe = redis.pipeline(transaction=False)
+   pipe.hset(objid,mapping=properties)
+   pipe.expire(objid,REDIS_EXPIRES)
+   pipe.execute()
+
+class PropertyWriter:
+   """Collects property updates across many objects and writes them in one pipeline."""
+
+   def __init__(self,redis):
+      self.redis = redis
+      self.updates = {}
+
+   def set(self,objid,propname,value):
+      self.updates.setdefault(objid,{})[propname] = value
+      return self
+
+   def flush(self):
+      if len(self.updates)==0:
+         return
+      pipe = self.redis.pipeline(transaction=False)
+      for objid,properties in self.updates.items():
+         pipe.hset(objid,mapping=properties)
+         pipe.expire(objid,REDIS_EXPIRES)
+      pipe.execute()
+      self.updates = {}
+
+   def __enter__(self):
+      return self
+
+   def __exit__(self,exc_type,exc_value,traceback):
+      self.flush()
 
 
 def get_property(redis,objid,propname):
    return redis.hget(objid,propname)
 
+def get_properties(redis,objid,*propnames):
+   return redis.hmget(objid,propnames)
+
 def get_object(redis,objid):
-   obj = {}
-   for propname in redis.hkeys(objid):
-      obj[propname] = redis.hget(objid,propname)
+   obj = redis.hgetall(objid)
    return obj if len(obj.keys())>0 else None
 
 def action_copy_job_id(app_id):
    return 'action-copy-job-'+app_id
 
-def invoke_application_log_copy(oozie,redis,parent_id,action_id,username,verbose=False):
+def invoke_application_log_copy(oozie,redis,parent_id,action_id,username,verbose=False,writer=None):
 
    logger = logging.getLogger(__name__)
    logger.info('Invoking copy from job {} for application {}'.format(parent_id,action_id))
@@ -155,10 +188,14 @@ yarn logs -applicationId $3 | hdfs dfs -put - $1/$2/$3.log
       verbose=verbose
    )
 
-   set_property(redis,parent_id,action_copy_job_id(action_id),jobid)
-   set_property(redis,jobid,'status','RUNNING')
-   set_property(redis,jobid,'path',path)
-   set_property(redis,jobid,'cleanup',True)
+   # the caller's writer batches these updates with others; otherwise they are written now
+   flush = writer is None
+   if flush:
+      writer = PropertyWriter(redis)
+   writer.set(parent_id,action_copy_job_id(action_id),jobid)
+   writer.set(jobid,'status','RUNNING').set(jobid,'path',path).set(jobid,'cleanup','True')
+   if flush:
+      writer.flush()
 
    return jobid
 
@@ -201,6 +238,9 @@ def request_job_ids():
       ids = None
    return ids
 
+def job_summary_expired(last_checked):
+   return last_checked is None or (datetime.now()-datetime.strptime(last_checked,'%Y-%m-%dT%H:%M:%S.%f')).seconds>job_update_expiry
+
 def get_job_summary(redis,job_id):
 
    logger = logging.getLogger(__name__)
@@ -210,7 +250,7 @@ def get_job_summary(redis,job_id):
       return None
 
    last_checked = job_summary.get('last-checked')
-   if last_checked is None or (datetime.now()-datetime.strptime(last_checked,'%Y-%m-%dT%H:%M:%S.%f')).seconds>job_update_expiry:
+   if job_summary_expired(last_checked):
       logger.info('{} is out of date, updating from {}'.format(job_id,last_checked))
       update_job_summary(redis,job_id)
    raw_app_ids = job_summary.get('application-ids')
@@ -227,21 +267,29 @@ def get_job_summary(redis,job_id):
 TRACKING_KEY = 'dataplatform.service.tracking'
 
 def tracking(redis,oozie_id):
-   redis.hset(TRACKING_KEY,oozie_id,datetime.now().isoformat())
-   redis.expire(TRACKING_KEY,REDIS_EXPIRES)
+   pipe = redis.pipeline(transaction=False)
+   pipe.hset(TRACKING_KEY,oozie_id,datetime.now().isoformat())
+   pipe.expire(TRACKING_KEY,REDIS_EXPIRES)
+   pipe.execute()
 
 def stop_tracking(redis,oozie_id):
-   redis.hdel(TRACKING_KEY,oozie_id)
-   redis.expire(TRACKING_KEY,REDIS_EXPIRES)
+   pipe = redis.pipeline(transaction=False)
+   pipe.hdel(TRACKING_KEY,oozie_id)
+   pipe.expire(TRACKING_KEY,REDIS_EXPIRES)
+   pipe.execute()
 
 def update_job_summary(redis,job_id):
    client = get_oozie_client(current_app,username=request.authorization.username if request.authorization is not None else None,password=request.authorization.password if request.authorization is not None else None)
-   info = client.status(job_id)
+   return store_job_summary(redis,job_id,client.status(job_id))
+
+def store_job_summary(redis,job_id,info):
    status = info.get('status')
    app_ids = application_ids(info)
-   set_property(redis,job_id,'status',status)
-   set_property(redis,job_id,'last-checked',datetime.now().isoformat())
-   set_property(redis,job_id,'application-ids',json.dumps(app_ids))
+   set_properties(redis,job_id,{
+      'status' : status,
+      'last-checked' : datetime.now().isoformat(),
+      'application-ids' : json.dumps(app_ids)
+   })
    return {
       'id' : job_id,
       'status' : status,
@@ -264,6 +312,7 @@ def service_track_job():
    auth = task_authenticate(redis,current_app.config.get('KEY'),request.authorization.username,request.authorization.password)
    for oozie_id in ids:
       task_id = task_create(redis,access=auth,type='track',oozie=oozie_id)
+      task_index_job(redis,oozie_id,task_id)
       tracking(redis,oozie_id)
       logger.info('Tracking {}, task {}'.format(oozie_id,task_id))
       try:
@@ -276,6 +325,20 @@ def service_track_job():
             raise err
    return api_response(200,summaries)
 
+@service_api.route('/job/<job_id>/notify')
+def service_job_notify(job_id):
+   # Oozie's workflow notification; the reported status is not trusted but the
+   # tracking task is run now to check the job with the stored credentials
+   logger = logging.getLogger(__name__)
+   redis = get_redis()
+   task_id = task_for_job(redis,job_id)
+   if task_id is None:
+      return error_response(404,'Job {} is not tracked.'.format(job_id))
+   logger.info('Notification for {}, status {}, checking task {}'.format(job_id,request.args.get('status'),task_id))
+   task_schedule(redis,task_id,time())
+   task_wake(redis)
+   return api_response(200,{'id':job_id,'task':task_id})
+
 def create_log_dir(client):
    client.createHDFSClient().make_directory('/user/'+request.authorization.username+'/WORK/logs')
 
@@ -331,8 +394,7 @@ def service_job_copy_logs():
       for oozie_id in ids:
          logger.info('Copying logs for {} ...'.format(oozie_id))
          redis = get_redis()
-         app_ids_json = get_property(redis,oozie_id,'application-ids') if not refresh else None
-         status = get_property(redis,oozie_id,'status') if not refresh else None
+         app_ids_json,status = get_properties(redis,oozie_id,'application-ids','status') if not refresh else (None,None)
          app_ids = json.loads(app_ids_json) if app_ids_json is not None else None
 
          #print(app_ids)
@@ -346,14 +408,14 @@ def service_job_copy_logs():
             app_ids = application_ids(info)
             status = info.get('status')
 
-            set_property(redis,oozie_id,'application-ids',json.dumps(app_ids))
-            set_property(redis,oozie_id,'status',status)
+            set_properties(redis,oozie_id,{'application-ids':json.dumps(app_ids),'status':status})
 
             create_log_dir(client)
 
             logger.info('Applications for {} are {}'.format(oozie_id,app_ids))
 
-            job_ids = list(map(lambda app_id : invoke_application_log_copy(client,redis,oozie_id,app_id,request.authorization.username),app_ids))
+            with PropertyWriter(redis) as writer:
+               job_ids = list(map(lambda app_id : invoke_application_log_copy(client,redis,oozie_id,app_id,request.authorization.username,writer=writer),app_ids))
             for i,log_job_id in enumerate(job_ids):
                app_id = app_ids[i]
                job_status.append({'id':oozie_id,'application':app_id,'job':log_job_id,'status':get_property(redis,log_job_id,'status')})
@@ -387,8 +449,7 @@ def service_job_copy_logs_status(oozie_id):
    client = get_oozie_client(current_app,username=request.authorization.username if request.authorization is not None else None,password=request.authorization.password if request.authorization is not None else None)
    try:
       redis = get_redis()
-      app_ids_json = get_property(redis,oozie_id,'application-ids')
-      status = get_property(redis,oozie_id,'status')
+      app_ids_json,status = get_properties(redis,oozie_id,'application-ids','status')
       app_ids = json.loads(app_ids_json) if app_ids_json is not None else None
 
       if app_ids is None:
@@ -413,8 +474,7 @@ def service_job_summary(job_id):
          info = client.status(job_id)
          status = info.get('status')
          app_ids = application_ids(info)
-         set_property(redis,job_id,'status',status)
-         set_property(redis,job_id,'application-ids',json.dumps(app_ids))
+         set_properties(redis,job_id,{'status':status,'application-ids':json.dumps(app_ids)})
          job_summary = {
             'status' : status,
             'applications-ids' : app_ids
@@ -443,8 +503,7 @@ def best_effort_logs(job_id,app_id=None):
    app_ids = application_ids(info) if app_id is None else [app_id]
    status = info.get('status')
 
-   set_property(redis,job_id,'status',status)
-   set_property(redis,job_id,'application-ids',json.dumps(application_ids(info)))
+   set_properties(redis,job_id,{'status':status,'application-ids':json.dumps(application_ids(info))})
 
    if status!='RUNNING':
       username = request.authorization.username
@@ -521,15 +580,13 @@ def service_job_status(job_id):
    client = get_oozie_client(current_app,username=request.authorization.username if request.authorization is not None else None,password=request.authorization.password if request.authorization is not None else None)
    try:
       redis = get_redis()
-      status = get_property(redis,job_id,'status')
-      app_ids_json = get_property(redis,job_id,'application-ids')
+      status,app_ids_json = get_properties(redis,job_id,'status','application-ids')
       app_ids = json.loads(app_ids_json) if app_ids_json is not None else None
       if status is None or status=='RUNNING' or refresh:
          info = client.status(id)
          status = info.get('status')
          app_ids = application_ids(info)
-         set_property(redis,job_id,'status',status)
-         set_property(redis,job_id,'application-ids',json.dumps(app_ids))
+         set_properties(redis,job_id,{'status':status,'application-ids':json.dumps(app_ids)})
       return api_response(200,{'id':job_id,'status':status,'status_code':200})
    except ServiceError as err:
       if err.status_code==404:
@@ -540,9 +597,17 @@ def service_job_status(job_id):
 @service_api.route('/jobs/tracking')
 def service_tracking_jobs():
    redis = get_redis()
+   logger = logging.getLogger(__name__)
    job_ids = redis.hkeys(TRACKING_KEY)
    job_list = []
    client = get_oozie_client(current_app,username=request.authorization.username if request.authorization is not None else None,password=request.authorization.password if request.authorization is not None else None)
+
+   # refresh the out of date summaries concurrently; errors are handled per job below
+   expired = [job_id for job_id in job_ids if len(job_id)>0 and redis.exists(job_id) and job_summary_expired(get_property(redis,job_id,'last-checked'))]
+   for job_id,info,err in client.status_many(expired):
+      if err is None:
+         store_job_summary(redis,job_id,info)
+
    for job_id in job_ids:
       if len(job_id)==0:
          continue
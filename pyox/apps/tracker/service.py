@@ -2,9 +2,9 @@ from flask import Flask, current_app, request
 from redis import Redis
 from pyox.apps.tracker.views import service_ui
 from pyox.apps.tracker.views import assets
-from pyox.apps.tracker.api import service_api, get_oozie_client, invoke_application_log_copy, application_ids, set_property, get_property, error_response
+from pyox.apps.tracker.api import service_api, get_oozie_client, invoke_application_log_copy, application_ids, set_property, set_properties, get_property, get_properties, error_response, PropertyWriter
 
-from pyox.apps.tracker.tasks import task_list, task_get, task_lock, task_unlock, task_authenticate, task_authentication, task_delete, task_set_property, task_create
+from pyox.apps.tracker.tasks import task_list, task_get, task_get_many, TASK_LIST_KEY, task_schedule, task_schedule_missing, task_unschedule, task_due, task_next_due, task_wait, task_wake, task_lock, task_relock, task_unlock, task_authenticate, task_authentication, task_delete, task_set_property, task_set_properties, task_create
 from pyox.apps.monitor.api import cluster_api
 from pyox import ServiceError
 
@@ -12,11 +12,13 @@ from pyox import ServiceError
 
 import logging
 import threading
+import queue
 import time
 import base64
 import json
 import sys
 import signal
+from datetime import datetime
 
 from atexit import register
 
@@ -42,6 +44,16 @@ def _get_redis(app):
          password = parts[2]
    return Redis(host=host,port=port,password=password,decode_responses=True)
 
+def _track_delay(app,info):
+   """The seconds until a job is checked again: new jobs often and long-running jobs less often."""
+   min_delay = app.config.get('TRACK_MIN_DELAY',10)
+   max_delay = app.config.get('TRACK_MAX_DELAY',600)
+   started = info.get('startTime')
+   if started is None:
+      return min_delay
+   age = (datetime.utcnow() - datetime.strptime(started,'%a, %d %b %Y %H:%M:%S GMT')).total_seconds()
+   return min(max(age/10,min_delay),max_delay)
+
 def _track_job(app,task,verbose=False):
    logger = logging.getLogger(__name__)
    task_id = task.get('id')
@@ -59,10 +71,9 @@ def _track_job(app,task,verbose=False):
       info = client.status(oozie)
       status = info.get('status')
       logger.info('Job {} status {}'.format(oozie,status))
-      set_property(redis,oozie,'status',status)
       app_ids = application_ids(info)
       logger.info('Job {}, applications: {}'.format(oozie,app_ids))
-      set_property(redis,oozie,'application-ids',json.dumps(app_ids))
+      set_properties(redis,oozie,{'status':status,'application-ids':json.dumps(app_ids)})
       if status=='SUCCEEDED':
          task_delete(redis,task_id)
       elif status in ['KILLED','FAILED']:
@@ -89,17 +100,19 @@ def _track_job(app,task,verbose=False):
                logger.info('No application logs to copy for {}'.format(oozie))
                task_delete(redis,task_id)
             else:
-               for app_id in app_ids:
-                  try:
-                     job_id = invoke_application_log_copy(client,redis,oozie,app_id,username,verbose=verbose)
-                     job_ids.append(job_id)
-                     logger.info('Copy job {} started.'.format(job_id))
-                  except:
-                     errors = True
-                     logger.error('Error invoking application log copy for {}/{}'.format(oozie,app_id), exc_info=True)
+               with PropertyWriter(redis) as writer:
+                  for app_id in app_ids:
+                     try:
+                        job_id = invoke_application_log_copy(client,redis,oozie,app_id,username,verbose=verbose,writer=writer)
+                        job_ids.append(job_id)
+                        logger.info('Copy job {} started.'.format(job_id))
+                     except:
+                        errors = True
+                        logger.error('Error invoking application log copy for {}/{}'.format(oozie,app_id), exc_info=True)
                if not errors:
-                  task_set_property(redis,task_id,'copied','RUNNING')
-                  task_set_property(redis,task_id,'copy_jobs',json.dumps(job_ids))
+                  task_set_properties(redis,task_id,copied='RUNNING',copy_jobs=json.dumps(job_ids))
+      else:
+         return _track_delay(app,info)
    except ServiceError as err:
       if err.status_code==404:
          logger.info('Job {} does not exist, deleting task {}'.format(oozie,task_id))
@@ -128,8 +141,7 @@ def _job_cleanup(app,task,verbose=False):
    client = get_oozie_client(app,username=username,password=password)
    hdfs = client.createHDFSClient()
 
-   path = get_property(redis,job_id,'path')
-   cleanup = get_property(redis,job_id,'cleanup')
+   path,cleanup = get_properties(redis,job_id,'path','cleanup')
    if bool(cleanup):
       exists = True
       try:
@@ -156,40 +168,239 @@ operations = {
 
 running = True
 
+def _claim_task(redis,task,timeout=60):
+   """Locks a task that still exists; returns the lock token or False."""
+   logger = logging.getLogger(__name__)
+   id = task['id']
+   token = task_lock(redis,id,timeout=timeout)
+   if not token:
+      logger.warn('Task {} is locked'.format(id))
+      return False
+
+   # the task may have been completed elsewhere since it was read
+   if not redis.hexists(TASK_LIST_KEY,id):
+      task_unlock(redis,id,token)
+      task_unschedule(redis,id)
+      return False
+   return token
+
+def _run_task(app,redis,task,delay=30,token=None,abandoned=None):
+   """Runs the task operation and schedules the next check.
+
+   The operation may return the number of seconds until the task should run
+   again; otherwise, the task runs again after the delay. If the abandoned event
+   is set when the operation finishes, the run has been given up on and the task
+   is neither rescheduled nor unlocked as it may have been claimed again.
+   """
+   logger = logging.getLogger(__name__)
+   id = task['id']
+   task_type = task.get('type')
+   operation = None
+   if task_type is None:
+      logger.warn('Task {} has no type'.format(id))
+   else:
+      operation = operations.get(task_type)
+      if operation is None:
+         logger.warn('No operation for type {}'.format(task_type))
+
+   # a task that cannot run is still rescheduled and unlocked
+   next_delay = None
+   if operation is not None:
+      try:
+         next_delay = operation(app,task,verbose=False)
+      except:
+         logger.error('Task {} operation {} failed'.format(id,task_type), exc_info=True)
+
+   if abandoned is not None and abandoned.is_set():
+      logger.warn('Task {} finished after it was abandoned'.format(id))
+      return
+
+   if redis.hexists(TASK_LIST_KEY,id):
+      task_schedule(redis,id,time.time()+(next_delay if next_delay is not None else delay))
+      task_wake(redis)
+   task_unlock(redis,id,token)
+
 def _update_tasks(app):
    logger = logging.getLogger(__name__)
    redis = _get_redis(app)
    try:
       logger.info('Checking tasks...')
-      for id in task_list(redis):
+      for task in task_get_many(redis):
          if not running:
             break
-         logger.info('Task {}'.format(id))
-         task = task_get(redis,id)
-
-         if not task_lock(redis,id):
-            logger.warn('Task {} is locked'.format(id))
-            continue
-
-         task_type = task.get('type')
-         if task_type is None:
-            logger.warn('Task {} has no type'.format(id))
-            continue
+         logger.info('Task {}'.format(task['id']))
+         token = _claim_task(redis,task)
+         if token:
+            _run_task(app,redis,task,token=token)
+      logger.info('Done checking tasks.')
+   except:
+      logger.error('Exception during processing tasks', exc_info=True)
 
-         operation = operations.get(task_type)
-         if operation is None:
-            logger.warn('No operation for type {}'.format(task_type))
+class TaskPool:
+   """Runs the tracker tasks on a pool of worker threads.
+
+   Every task has a next check time in a Redis sorted set. A dispatcher claims the
+   tasks that are due with task_lock and hands them to the workers through a
+   bounded queue; it stops claiming tasks while every worker is busy. Between
+   checks, the dispatcher sleeps until the next task is due or a task is created.
+
+   The lock and the next check time are restamped when a worker starts a task, so
+   that the time a task waited in the queue does not count against its timeout. A
+   task that runs longer than the timeout is abandoned by its worker and its lock
+   is left to expire; the abandoned run neither unlocks nor reschedules the task when
+   it finishes. While max_abandoned abandoned runs are still going, the workers wait
+   before taking more tasks. On shutdown, claimed tasks that have not started are released
+   and the workers finish the tasks they are running.
+   """
+
+   def __init__(self,app,workers=4,interval=30,timeout=300,max_abandoned=None):
+      self.app = app
+      self.workers = workers
+      self.interval = interval
+      self.timeout = timeout
+      self.max_abandoned = max_abandoned if max_abandoned is not None else workers
+      self.abandoned = []
+      self.queue = queue.Queue(maxsize=workers)
+      self.event = threading.Event()
+      self.active = set()
+      self.lock = threading.Lock()
+
+   def start(self):
+      logger = logging.getLogger(__name__)
+      started = [threading.Thread(name=_task_thread_name(),target=self.dispatch)]
+      for i in range(self.workers):
+         started.append(threading.Thread(name=_task_thread_name(),target=self.work))
+      for thread in started:
+         threads.append((self.event,thread))
+         logger.info('Setup background thread {}'.format(thread.name))
+         thread.start()
+
+   def _offer(self,task):
+      while running:
+         try:
+            self.queue.put(task,timeout=1)
+            return True
+         except queue.Full:
+            pass
+      return False
+
+   def _dispatch_tasks(self,redis):
+      """Hands the due tasks to the workers; returns the number of due tasks that
+      could not be claimed (e.g., still running or locked)."""
+      logger = logging.getLogger(__name__)
+      due = task_due(redis)
+      if len(due)==0:
+         return 0
+      logger.info('Dispatching {} tasks...'.format(len(due)))
+      skipped = 0
+      for task in task_get_many(redis,due):
+         if not running:
+            break
+         id = task['id']
+         with self.lock:
+            if id in self.active:
+               skipped += 1
+               continue
+         token = _claim_task(redis,task,timeout=self.timeout)
+         if not token:
+            skipped += 1
             continue
+         # not due again until it has been run or abandoned
+         task_schedule(redis,id,time.time()+self.timeout)
+         with self.lock:
+            self.active.add(id)
+         if not self._offer((task,token)):
+            task_unlock(redis,id,token)
+            task_schedule(redis,id,time.time())
+            with self.lock:
+               self.active.discard(id)
+            break
+      logger.info('Done dispatching tasks.')
+      return skipped
 
+   def dispatch(self):
+      logger = logging.getLogger(__name__)
+      redis = _get_redis(self.app)
+      last_sweep = 0
+      while running:
+         wait = self.interval
          try:
-            operation(app,task,verbose=False)
+            if time.time()-last_sweep>=self.interval:
+               task_schedule_missing(redis)
+               last_sweep = time.time()
+            skipped = self._dispatch_tasks(redis)
+            next_due = task_next_due(redis)
+            if next_due is not None:
+               # due tasks that were skipped are retried after a pause instead of a busy loop
+               wait = min(max(next_due-time.time(),1 if skipped>0 else 0),self.interval)
          except:
-            logger.error('Task {} operation {} failed'.format(id,task_type), exc_info=True)
-
-         task_unlock(redis,id)
-      logger.info('Done checking tasks.')
-   except:
-      logger.error('Exception during processing tasks', exc_info=True)
+            logger.error('Exception during dispatching tasks', exc_info=True)
+         if wait>=1 and running:
+            # wake up early when a task is scheduled; a short timeout keeps shutdown responsive
+            try:
+               task_wait(redis,min(int(wait),5))
+            except:
+               logger.error('Exception waiting for tasks', exc_info=True)
+               self.event.wait(timeout=wait)
+         elif wait>0:
+            self.event.wait(timeout=wait)
+
+      # drain: release the tasks that were claimed but not started
+      while True:
+         try:
+            item = self.queue.get_nowait()
+         except queue.Empty:
+            break
+         if item is not None:
+            task,token = item
+            task_unlock(redis,task['id'],token)
+            task_schedule(redis,task['id'],time.time())
+      for i in range(self.workers):
+         self.queue.put(None)
+
+   def _abandoned_count(self):
+      with self.lock:
+         self.abandoned = [thread for thread in self.abandoned if thread.is_alive()]
+         return len(self.abandoned)
+
+   def work(self):
+      logger = logging.getLogger(__name__)
+      redis = _get_redis(self.app)
+      while True:
+         if self._abandoned_count()>=self.max_abandoned:
+            logger.warn('{} abandoned tasks are still running, waiting for them to finish'.format(self.max_abandoned))
+            while running and self._abandoned_count()>=self.max_abandoned:
+               self.event.wait(timeout=1)
+         item = self.queue.get()
+         if item is None:
+            break
+         task,token = item
+         id = task['id']
+         # the lock and the schedule are restamped so the timeout counts from the start
+         # of the run rather than the claim, as the task may have waited in the queue
+         try:
+            token = task_relock(redis,id,token)
+         except:
+            logger.error('Cannot restamp the lock of task {}'.format(id), exc_info=True)
+            token = False
+         if not token:
+            logger.warn('Task {} was claimed again while it was queued, skipping it'.format(id))
+            with self.lock:
+               self.active.discard(id)
+            continue
+         task_schedule(redis,id,time.time()+self.timeout)
+         logger.info('Task {}'.format(id))
+         abandoned = threading.Event()
+         runner = threading.Thread(name=threading.current_thread().name+'.run',target=_run_task,args=[self.app,redis,task],kwargs={'delay':self.interval,'token':token,'abandoned':abandoned},daemon=True)
+         runner.start()
+         runner.join(self.timeout)
+         if runner.is_alive():
+            abandoned.set()
+            with self.lock:
+               self.abandoned.append(runner)
+            logger.error('Task {} did not finish within {} seconds, abandoning it ({} abandoned tasks running)'.format(id,self.timeout,self._abandoned_count()))
+         with self.lock:
+            self.active.discard(id)
 
 threads = []
 
@@ -219,16 +430,29 @@ def create_app(name):
 
    @fapp.before_request
    def check_auth():
+      # Oozie does not authenticate its notifications
+      if request.endpoint=='service_api.service_job_notify':
+         return
       if request.authorization is None:
          return error_response(401,'Authorization required')
 
    return fapp
 
-def start_task_queue(app,task_updater=_update_tasks):
+def start_task_queue(app,task_updater=None):
    global running
    global threads
    logger = logging.getLogger(__name__)
 
+   if task_updater is None:
+      pool = TaskPool(
+         app,
+         workers=app.config.get('TASK_WORKERS',4),
+         interval=app.config.get('TASK_INTERVAL',30),
+         timeout=app.config.get('TASK_TIMEOUT',300),
+         max_abandoned=app.config.get('TASK_MAX_ABANDONED'))
+      pool.start()
+      return pool
+
    event = threading.Event()
    def run_check(app):
       while running:
@@ -1,20 +1,25 @@
 from redis import Redis
 from redis.lock import Lock
+from redis.exceptions import WatchError
 import logging
 import base64
 import os
+import time
 from datetime import datetime
 from cryptography.fernet import Fernet
 
 from uuid import uuid4
 
 TASK_LIST_KEY = 'dataplatform.service.tasks'
+TASK_SCHEDULE_KEY = 'dataplatform.service.tasks.schedule'
+TASK_WAKE_KEY = 'dataplatform.service.tasks.wake'
+TASK_JOB_KEY = 'dataplatform.service.tasks.jobs'
 
 def task_list(redis):
    return redis.hkeys(TASK_LIST_KEY)
 
 def task_authenticate(redis,key,username,password):
-   id = uuid4()
+   id = str(uuid4())
    auth = username+':'+password
    bauth = auth.encode('utf-8')
    if type(key)==str:
@@ -34,57 +39,168 @@ def task_authentication(redis,key,id):
    return auth.split(':')
 
 def task_create(redis,**kwargs):
-   task_id = uuid4()
-   for name in kwargs:
-      redis.hset(task_id,name,kwargs[name])
-   redis.hset(TASK_LIST_KEY,task_id,datetime.now().isoformat())
+   task_id = str(uuid4())
+   pipe = redis.pipeline(transaction=False)
+   if len(kwargs)>0:
+      pipe.hset(task_id,mapping=kwargs)
+   pipe.hset(TASK_LIST_KEY,task_id,datetime.now().isoformat())
+   # due immediately
+   pipe.zadd(TASK_SCHEDULE_KEY,{task_id:time.time()})
+   pipe.execute()
+   task_wake(redis)
    return task_id
 
+def task_index_job(redis,oozie_id,id):
+   """Records the task that tracks an Oozie job."""
+   redis.hset(TASK_JOB_KEY,oozie_id,id)
+
+def task_for_job(redis,oozie_id):
+   """Returns the task tracking an Oozie job or None if the job is not tracked."""
+   id = redis.hget(TASK_JOB_KEY,oozie_id)
+   if id is not None and not redis.hexists(TASK_LIST_KEY,id):
+      redis.hdel(TASK_JOB_KEY,oozie_id)
+      return None
+   return id
+
+def task_schedule(redis,id,when):
+   redis.zadd(TASK_SCHEDULE_KEY,{id:when})
+
+def task_schedule_missing(redis):
+   """Schedules any listed task that has no next check time (e.g., from an older version)."""
+   ids = task_list(redis)
+   if len(ids)>0:
+      now = time.time()
+      redis.zadd(TASK_SCHEDULE_KEY,{id:now for id in ids},nx=True)
+
+def task_unschedule(redis,id):
+   redis.zrem(TASK_SCHEDULE_KEY,id)
+
+def task_due(redis,now=None):
+   return redis.zrangebyscore(TASK_SCHEDULE_KEY,'-inf',now if now is not None else time.time())
+
+def task_next_due(redis):
+   first = redis.zrange(TASK_SCHEDULE_KEY,0,0,withscores=True)
+   return first[0][1] if len(first)>0 else None
+
+def task_wake(redis):
+   """Wakes up a dispatcher waiting in task_wait."""
+   pipe = redis.pipeline(transaction=False)
+   pipe.rpush(TASK_WAKE_KEY,'wake')
+   pipe.ltrim(TASK_WAKE_KEY,-100,-1)
+   pipe.execute()
+
+def task_wait(redis,timeout):
+   """Waits at most timeout seconds for task_wake; returns True if woken."""
+   return redis.blpop(TASK_WAKE_KEY,timeout=timeout) is not None
+
+def _lock_token():
+   return datetime.now().isoformat()+'|'+str(uuid4())
+
 def task_lock(redis,id,timeout=60):
+   """Locks a task; returns the lock token or False if the task is locked.
+
+   The token must be given to task_unlock so that a lock that went stale and was
+   claimed by another worker is not released.
+   """
    lock_name = id+'.lock'
-   if redis.setnx(lock_name,datetime.now().isoformat()):
-      return True
+   token = _lock_token()
+   if redis.setnx(lock_name,token):
+      return token
    else:
       tstamp = redis.get(lock_name)
-      locked_on = datetime.strptime(tstamp,"%Y-%m-%dT%H:%M:%S.%f")
+      if tstamp is None:
+         return task_lock(redis,id,timeout=timeout)
+      locked_on = datetime.strptime(tstamp.split('|')[0],"%Y-%m-%dT%H:%M:%S.%f")
       delta = datetime.now() - locked_on
       if delta.seconds > timeout:
-         redis.delete(lock_name)
+         task_unlock(redis,id,tstamp)
          return task_lock(redis,id,timeout=timeout)
       else:
          return False
 
-def task_unlock(redis,id):
+def task_relock(redis,id,token):
+   """Restamps a lock that is still held with a token (e.g., when a claimed task
+   starts running); returns the new token or False if the lock was lost."""
+   lock_name = id+'.lock'
+   with redis.pipeline() as pipe:
+      try:
+         pipe.watch(lock_name)
+         if pipe.get(lock_name)!=token:
+            pipe.unwatch()
+            return False
+         renewed = _lock_token()
+         pipe.multi()
+         pipe.set(lock_name,renewed)
+         pipe.execute()
+         return renewed
+      except WatchError:
+         return False
+
+def task_unlock(redis,id,token=None):
+   """Releases a task lock; with a token, only if the lock is still held with it."""
    lock_name = id+'.lock'
-   redis.delete(lock_name)
+   if token is None:
+      redis.delete(lock_name)
+      return True
+   with redis.pipeline() as pipe:
+      try:
+         pipe.watch(lock_name)
+         if pipe.get(lock_name)!=token:
+            pipe.unwatch()
+            return False
+         pipe.multi()
+         pipe.delete(lock_name)
+         pipe.execute()
+         return True
+      except WatchError:
+         return False
 
 def task_get(redis,id):
-   task = {'id':id}
-   for name in redis.hkeys(id):
-      task[name] = redis.hget(id,name)
+   task = redis.hgetall(id)
+   task['id'] = id
    return task
 
+def task_get_many(redis,ids=None):
+   """Reads many tasks (by default, every task in the list) in one pipeline."""
+   if ids is None:
+      ids = task_list(redis)
+   pipe = redis.pipeline(transaction=False)
+   for id in ids:
+      pipe.hgetall(id)
+   tasks = []
+   for id,task in zip(ids,pipe.execute()):
+      task['id'] = id
+      tasks.append(task)
+   return tasks
+
 def task_set_properties(redis,id,**kwargs):
-   for name in kwargs:
-      redis.hset(id,name,kwargs[name])
+   if len(kwargs)>0:
+      redis.hset(id,mapping=kwargs)
 
 def task_set_property(redis,id,name,value):
    redis.hset(id,name,value)
 
 def task_delete_properties(redis,id,*args):
-   for name in args:
-      redis.hdel(id,name)
+   if len(args)>0:
+      redis.hdel(id,*args)
 
 def task_delete_property(redis,id,name):
    redis.hdel(id,name)
 
 def task_get_properties(redis,id,*args):
-   return list(map(lambda name:redis.hdget(id,name),args))
+   return redis.hmget(id,args)
 
 def task_get_property(redis,id,name):
-   redis.hget(id,name)
+   return redis.hget(id,name)
 
 def task_delete(redis,id):
-   for name in redis.hkeys(id):
-      redis.hdel(id,name)
-   redis.hdel(TASK_LIST_KEY,id)
+   # the job index entry is removed only if it still refers to this task
+   oozie_id = redis.hget(id,'oozie')
+   indexed = redis.hget(TASK_JOB_KEY,oozie_id) if oozie_id is not None else None
+   pipe = redis.pipeline(transaction=False)
+   pipe.delete(id)
+   if indexed==id:
+      pipe.hdel(TASK_JOB_KEY,oozie_id)
+   pipe.hdel(TASK_LIST_KEY,id)
+   pipe.zrem(TASK_SCHEDULE_KEY,id)
+   pipe.execute()
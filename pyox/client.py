@@ -1,10 +1,14 @@
 import requests
 import logging
 from requests.auth import HTTPBasicAuth
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from http.cookiejar import DefaultCookiePolicy
 import sys
 import os
 import base64
 import argparse
+import threading
 from types import FunctionType
 
 try:
@@ -57,9 +61,49 @@ class ServiceError(Exception):
          self.data = response_data(request)
 
 
+class SessionPool:
+   """A thread-safe pool of keep-alive connections shared by clients.
+
+   Every thread gets its own requests.Session but all of them are mounted on the
+   same transport adapter and so share the per-host connection pools. Sessions
+   never store response cookies as clients for different users may share a pool.
+   """
+
+   def __init__(self,pool_connections=10,pool_maxsize=10,max_retries=0,backoff_factor=0):
+      self.pool_connections = pool_connections
+      self.pool_maxsize = pool_maxsize
+      self.max_retries = max_retries
+      # only connection failures are retried; a request body may not be replayable
+      retries = Retry(total=max_retries,read=False,backoff_factor=backoff_factor)
+      self.adapter = HTTPAdapter(pool_connections=pool_connections,pool_maxsize=pool_maxsize,max_retries=retries)
+      self._local = threading.local()
+
+   def session(self):
+      session = getattr(self._local,'session',None)
+      if session is None:
+         session = requests.Session()
+         session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+         session.mount('http://',self.adapter)
+         session.mount('https://',self.adapter)
+         self._local.session = session
+      return session
+
+   def close(self):
+      self.adapter.close()
+
+_default_session_pool = None
+_default_session_pool_lock = threading.Lock()
+
+def default_session_pool():
+   global _default_session_pool
+   with _default_session_pool_lock:
+      if _default_session_pool is None:
+         _default_session_pool = SessionPool()
+      return _default_session_pool
+
 class Client:
 
-   def __init__(self,service='',base=None,secure=False,host='localhost',port=50070,gateway=None,username=None,password=None,cookies=None,bearer_token=None,bearer_token_encode=True,**extrakeywords):
+   def __init__(self,service='',base=None,secure=False,host='localhost',port=50070,gateway=None,username=None,password=None,cookies=None,bearer_token=None,bearer_token_encode=True,session_pool=None,**extrakeywords):
       self.service = service
       self.base = base
       if self.base is not None and self.base[-1]!='/':
@@ -83,6 +127,10 @@ class Client:
       self.verbose = False
       self.progress = False
       self.negotiate = False
+      self.session_pool = session_pool if session_pool is not None else default_session_pool()
+
+   def session(self):
+      return self.session_pool.session()
 
    def enable_verbose(self):
       self.verbose = True;
@@ -137,7 +185,7 @@ class Client:
 
    @verbose_log
    def post(self,url,params={},data=None,headers=None,allow_redirects=True):
-      return requests.post(
+      return self.session().post(
          url,
          params=params,
          auth=self.auth(),
@@ -150,7 +198,7 @@ class Client:
 
    @verbose_log
    def put(self,url,params={},data=None,headers=None,allow_redirects=True):
-      return requests.put(
+      return self.session().put(
          url,
          params=params,
          auth=self.auth(),
@@ -163,7 +211,7 @@ class Client:
 
    @verbose_log
    def get(self,url,params={},allow_redirects=True,stream=False):
-      return requests.get(
+      return self.session().get(
          url,
          params=params,
          auth=self.auth(),
@@ -176,7 +224,7 @@ class Client:
 
    @verbose_log
    def delete(self,url,params={},allow_redirects=True):
-      return requests.delete(
+      return self.session().delete(
          url,
          params=params,
          auth=self.auth(),
@@ -0,0 +1,176 @@
+import queue
+import threading
+import zlib
+
+EXTENSIONS = {
+   'gzip' : '.gz',
+   'zstd' : '.zst',
+   'lz4' : '.lz4'
+}
+
+MAGIC = [
+   (b'\x1f\x8b','gzip'),
+   (b'\x28\xb5\x2f\xfd','zstd'),
+   (b'\x04\x22\x4d\x18','lz4')
+]
+
+def _module(method):
+   try:
+      if method=='zstd':
+         import zstandard
+         return zstandard
+      elif method=='lz4':
+         import lz4.frame
+         return lz4.frame
+   except ImportError:
+      raise ValueError('The {} module is required for {} compression'.format('zstandard' if method=='zstd' else 'lz4',method))
+   return None
+
+def available_methods():
+   """Returns the compression methods whose modules can be imported."""
+   methods = []
+   for method in EXTENSIONS:
+      try:
+         _module(method)
+         methods.append(method)
+      except ValueError:
+         pass
+   return methods
+
+def method_for_path(path):
+   """Returns the compression method for the extension of a path or None."""
+   for method,extension in EXTENSIONS.items():
+      if path.endswith(extension):
+         return method
+   return None
+
+def detect_method(data):
+   """Returns the compression method for the magic number at the start of data or None."""
+   for magic,method in MAGIC:
+      if data[0:len(magic)]==magic:
+         return method
+   return None
+
+class _LZ4Compressor:
+   def __init__(self,level):
+      self.compressor = _module('lz4').LZ4FrameCompressor(compression_level=level)
+      self.started = False
+
+   def compress(self,data):
+      if not self.started:
+         self.started = True
+         return self.compressor.begin() + self.compressor.compress(data)
+      return self.compressor.compress(data)
+
+   def flush(self):
+      prefix = b'' if self.started else self.compressor.begin()
+      return prefix + self.compressor.flush()
+
+def compressor(method,level=None):
+   """Returns an object with compress(data) and flush() methods for a method."""
+   if method=='gzip':
+      return zlib.compressobj(level if level is not None else 6,zlib.DEFLATED,31)
+   elif method=='zstd':
+      return _module(method).ZstdCompressor(level=level if level is not None else 3).compressobj()
+   elif method=='lz4':
+      return _LZ4Compressor(level if level is not None else 0)
+   raise ValueError('Unknown compression method {}'.format(method))
+
+def decompressor(method):
+   """Returns an object with a decompress(data) method and eof and unused_data
+   attributes for a single stream (member or frame) of a method."""
+   if method=='gzip':
+      return zlib.decompressobj(31)
+   elif method=='zstd':
+      return _module(method).ZstdDecompressor().decompressobj()
+   elif method=='lz4':
+      return _module(method).LZ4FrameDecompressor()
+   raise ValueError('Unknown compression method {}'.format(method))
+
+def compress_stream(chunks,method,level=None):
+   """Compresses an iterable of bytes."""
+   codec = compressor(method,level)
+   for chunk in chunks:
+      data = codec.compress(chunk)
+      if data:
+         yield data
+   data = codec.flush()
+   if data:
+      yield data
+
+def decompress_stream(chunks,method=None):
+   """Decompresses an iterable of bytes, detecting the method from the data
+   when it is not given. Concatenated streams (e.g., gzip members) are
+   decompressed in sequence. A ValueError is raised if the data ends within
+   a stream."""
+   magic_size = max(len(magic) for magic,detected in MAGIC)
+   codec = None
+   pending = b''
+   def feed(chunk):
+      nonlocal codec, method
+      while chunk:
+         if method is None:
+            method = detect_method(chunk)
+            if method is None:
+               raise ValueError('Cannot detect the compression of the data')
+         if codec is None:
+            codec = decompressor(method)
+         data = codec.decompress(chunk)
+         if data:
+            yield data
+         chunk = b''
+         if getattr(codec,'eof',False):
+            chunk = codec.unused_data
+            codec = None
+   for chunk in chunks:
+      if method is None:
+         # the method is detected once enough data for a magic number has arrived
+         pending += chunk
+         if len(pending)<magic_size:
+            continue
+         chunk = pending
+         pending = b''
+      yield from feed(chunk)
+   yield from feed(pending)
+   # a decompressor without an eof attribute cannot tell whether the data is complete
+   if codec is not None and not getattr(codec,'eof',True):
+      raise ValueError('The {} compressed data is truncated'.format(method))
+
+def threaded(iterable,max_pending=8):
+   """Iterates an iterable in a separate thread so that its work (reading,
+   compressing, etc.) overlaps with the work of the consumer."""
+   items = queue.Queue(maxsize=max_pending)
+   stop = threading.Event()
+   done = object()
+
+   def offer(entry):
+      # gives up when the consumer has stopped
+      while not stop.is_set():
+         try:
+            items.put(entry,timeout=0.5)
+            return True
+         except queue.Full:
+            pass
+      return False
+
+   def produce():
+      try:
+         for item in iterable:
+            if not offer((item,None)):
+               return
+         offer((done,None))
+      except BaseException as err:
+         offer((done,err))
+
+   thread = threading.Thread(target=produce,daemon=True)
+   thread.start()
+   try:
+      while True:
+         item,err = items.get()
+         if item is done:
+            if err is not None:
+               raise err
+            return
+         yield item
+   finally:
+      stop.set()
@@ -1,20 +1,58 @@
-from pyox.webhdfs import WebHDFS
-from pyox.client import ServiceError
+from pyox.webhdfs import WebHDFS, DEFAULT_BLOCK_SIZE, local_checksum, collapse_paths, has_magic, join_path, absolute_path
+from pyox.client import ServiceError, SessionPool
+from pyox.compression import EXTENSIONS, compress_stream, decompress_stream, method_for_path, threaded
 from datetime import datetime
 import argparse
 import sys
 import os
+import shutil
 from os.path import isfile
 from glob import glob
 from math import ceil
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from fnmatch import fnmatch
+import re
+import threading
+import time
 
 class tracker:
 
    def __init__(self):
       self.values = set()
+      self.lock = threading.Lock()
+      self.pending = {}
 
    def add(self,value):
-      self.values.add(value)
+      with self.lock:
+         self.values.add(value)
+
+   def ensure(self,value,create):
+      """Calls create for the value only once, even across threads. Only the
+      threads ensuring the same value wait for each other."""
+      with self.lock:
+         if value in self.values:
+            return True
+         lock = self.pending.setdefault(value,threading.Lock())
+      with lock:
+         with self.lock:
+            if value in self.values:
+               return True
+         if not create(value):
+            return False
+         with self.lock:
+            self.values.add(value)
+            self.pending.pop(value,None)
+         return True
+
+def format_size(size,reportbytes=False):
+   if reportbytes or size<1024:
+      return str(size)+'B'
+   elif size<1048576:
+      return '{:0.1f}KB'.format(size/1024)
+   elif size<1073741824:
+      return '{:0.1f}MB'.format(size/1024/1024)
+   else:
+      return '{:0.1f}GB'.format(size/1024/1024/1024)
 
 def hdfs_ls_command(client,argv):
    lsparser = argparse.ArgumentParser(prog='pyox hdfs ls',description="ls")
@@ -30,6 +68,12 @@ def hdfs_ls_command(client,argv):
       dest='detailed',
       default=False,
       help="List details")
+   lsparser.add_argument(
+      '-R',
+      action='store_true',
+      dest='recursive',
+      default=False,
+      help="List subdirectories recursively")
    lsparser.add_argument(
       'paths',
       nargs='*',
@@ -39,39 +83,114 @@ def hdfs_ls_command(client,argv):
    if len(lsargs.paths)==0:
       lsargs.paths = ['/']
    for path in lsargs.paths:
-      listing = client.list_directory(path)
-      max = 0;
-      for name in sorted(listing):
-         if len(name)>max:
-            max = len(name)
-      for name in sorted(listing):
-
+      if lsargs.recursive:
+         for entry_path,info in client.iter_tree(path):
+            if info.is_directory:
+               entry_path = entry_path + '/'
+            if lsargs.detailed:
+               fsize = format_size(info.length,lsargs.reportbytes) if not info.is_directory else '0'
+               modtime = datetime.fromtimestamp(info.modification_time/1e3)
+               print('{}\t{}\t{}'.format(entry_path,fsize,modtime.isoformat()))
+            else:
+               print(entry_path)
+         continue
+      # entries are printed as the listing pages arrive (in HDFS name order)
+      for info in client.iter_directory(path):
+         name = info.name
+         if name=='':
+            name = path[path.rfind('/')+1:]
          if not lsargs.detailed:
             print(name)
             continue
 
-         info = listing[name]
-         if name=='':
-            name = path[path.rfind('/')+1:]
-            max = len(name)
-         ftype = info['type']
-         size = int(info['length'])
-         modtime = datetime.fromtimestamp(int(info['modificationTime'])/1e3)
+         modtime = datetime.fromtimestamp(info.modification_time/1e3)
 
-         fspec = '{:'+str(max)+'}\t{}\t{}'
          fsize = '0'
-         if ftype=='DIRECTORY':
+         if info.is_directory:
             name = name + '/'
          else:
-            if lsargs.reportbytes or size<1024:
-               fsize = str(size)+'B'
-            elif size<1048576:
-               fsize = '{:0.1f}KB'.format(size/1024)
-            elif size<1073741824:
-               fsize = '{:0.1f}MB'.format(size/1024/1024)
+            fsize = format_size(info.length,lsargs.reportbytes)
+         print('{}\t{}\t{}'.format(name,fsize,modtime.isoformat()))
+
+def hdfs_du_command(client,argv):
+   duparser = argparse.ArgumentParser(prog='pyox hdfs du',description="du")
+   duparser.add_argument(
+      '-b',
+      action='store_true',
+      dest='reportbytes',
+      default=False,
+      help="Report sizes in bytes")
+   duparser.add_argument(
+      '-s',
+      action='store_true',
+      dest='summary',
+      default=False,
+      help="Report only the total for each path")
+   duparser.add_argument(
+      '--sort',
+      choices=['size','name'],
+      default='size',
+      help="Sort by size (largest first) or name")
+   duparser.add_argument(
+      '--stream',
+      action='store_true',
+      dest='stream',
+      default=False,
+      help="Report each path as soon as its summary arrives (unsorted)")
+   duparser.add_argument(
+      '-w','--workers',
+      dest='workers',
+      type=int,
+      default=8,
+      metavar=('int'),
+      help="The number of summaries to request concurrently")
+   duparser.add_argument(
+      'paths',
+      nargs='*',
+      help='a list of paths (glob patterns)')
+   args = duparser.parse_args(argv)
+
+   if len(args.paths)==0:
+      args.paths = ['/']
+   paths = expand_paths(client,args.paths,workers=args.workers)
+   if not args.summary:
+      # the children of each path, where the files are reported from the listing
+      children = []
+      files = []
+      for path in paths:
+         for info in client.iter_directory(path):
+            if info.name=='':
+               files.append((path,info.length,info.length*info.replication))
+            elif info.is_directory:
+               children.append(join_path(path,info.name))
             else:
-               fsize = '{:0.1f}GB'.format(size/1024/1024/1024)
-         print(fspec.format(name,fsize,modtime.isoformat()))
+               files.append((join_path(path,info.name),info.length,info.length*info.replication))
+      paths = children
+   else:
+      files = []
+
+   def report(path,length,consumed):
+      print('{}\t{}\t{}'.format(format_size(length,args.reportbytes),format_size(consumed,args.reportbytes),path))
+
+   results = []
+   if args.stream:
+      for path,length,consumed in files:
+         report(path,length,consumed)
+   else:
+      results += files
+   for path,summary,err in client.content_summaries(paths,workers=args.workers):
+      if err is not None:
+         sys.stderr.write('{}\tERROR ({}) {}\n'.format(path,err.status_code,err.message))
+      elif args.stream:
+         report(path,summary['length'],summary['spaceConsumed'])
+      else:
+         results.append((path,summary['length'],summary['spaceConsumed']))
+   if args.sort=='size':
+      results.sort(key=lambda result : (-result[1],result[0]))
+   else:
+      results.sort()
+   for path,length,consumed in results:
+      report(path,length,consumed)
 
 def hdfs_cat_command(client,argv):
    catparser = argparse.ArgumentParser(prog='pyox hdfs cat',description="cat")
@@ -85,6 +204,12 @@ def hdfs_cat_command(client,argv):
       type=int,
       metavar=('int'),
       help="the byte length to retrieve")
+   catparser.add_argument(
+      '--decompress',
+      action='store_true',
+      dest='decompress',
+      default=False,
+      help="decompress the files (gzip, zstd or lz4, detected from the data)")
    catparser.add_argument(
       'paths',
       nargs='*',
@@ -92,9 +217,126 @@ def hdfs_cat_command(client,argv):
    args = catparser.parse_args(argv)
    for path in args.paths:
       input = client.open(path,offset=args.offset,length=args.length)
+      if args.decompress:
+         # the data is received in a separate thread while it is decompressed
+         input = decompress_stream(threaded(input))
       for chunk in input:
          sys.stdout.buffer.write(chunk)
 
+def head_tail_parser(command,description):
+   parser = argparse.ArgumentParser(prog='pyox hdfs '+command,description=description)
+   parser.add_argument(
+      '-n','--lines',
+      dest='lines',
+      type=int,
+      default=10,
+      metavar=('int'),
+      help="The number of lines (defaults to 10)")
+   parser.add_argument(
+      '-c','--bytes',
+      dest='bytes',
+      type=int,
+      metavar=('int'),
+      help="The number of bytes instead of lines")
+   parser.add_argument(
+      '--window',
+      dest='window',
+      type=int,
+      default=65536,
+      metavar=('int'),
+      help="The initial size of the ranges read for lines (doubled until enough lines are read)")
+   parser.add_argument(
+      '-q','--quiet',
+      action='store_true',
+      dest='quiet',
+      default=False,
+      help="Never print a header with the file name")
+   return parser
+
+def write_header(path,first):
+   sys.stdout.buffer.write('{}==> {} <==\n'.format('' if first else '\n',path).encode('utf-8'))
+
+def hdfs_head_command(client,argv):
+   headparser = head_tail_parser('head','Prints the start of files')
+   headparser.add_argument(
+      'paths',
+      nargs='+',
+      help='a list of paths')
+   args = headparser.parse_args(argv)
+   headers = len(args.paths)>1 and not args.quiet
+   for index,path in enumerate(args.paths):
+      if headers:
+         write_header(path,index==0)
+      if args.bytes is not None:
+         size = client.status(path)['length']
+         data = client.read_range(path,0,min(args.bytes,size)) if args.bytes>0 else b''
+      else:
+         data = client.head(path,lines=args.lines,window=args.window)
+      sys.stdout.buffer.write(data)
+   sys.stdout.buffer.flush()
+
+def hdfs_tail_command(client,argv):
+   tailparser = head_tail_parser('tail','Prints the end of files')
+   tailparser.add_argument(
+      '-f','--follow',
+      action='store_true',
+      dest='follow',
+      default=False,
+      help="Output the data appended to the files as they grow")
+   tailparser.add_argument(
+      '-s','--sleep-interval',
+      dest='interval',
+      type=float,
+      default=1.0,
+      metavar=('float'),
+      help="The seconds between checks of the file lengths when following (defaults to 1)")
+   tailparser.add_argument(
+      'paths',
+      nargs='+',
+      help='a list of paths')
+   args = tailparser.parse_args(argv)
+   headers = len(args.paths)>1 and not args.quiet
+   offsets = {}
+   for index,path in enumerate(args.paths):
+      if headers:
+         write_header(path,index==0)
+      size = client.status(path)['length']
+      if args.bytes is not None:
+         count = min(args.bytes,size)
+         data = client.read_range(path,size-count,count) if count>0 else b''
+      else:
+         data = client.tail(path,lines=args.lines,window=args.window,length=size)
+      sys.stdout.buffer.write(data)
+      offsets[path] = size
+   sys.stdout.buffer.flush()
+   if not args.follow:
+      return
+
+   # each file is followed in its own thread and a header is written when the output switches files
+   lock = threading.Lock()
+   last = [args.paths[-1]]
+   def follow(path):
+      try:
+         for chunk in client.follow(path,offset=offsets[path],interval=args.interval):
+            with lock:
+               if headers and last[0]!=path:
+                  write_header(path,False)
+                  last[0] = path
+               sys.stdout.buffer.write(chunk)
+               sys.stdout.buffer.flush()
+      except ServiceError as err:
+         with lock:
+            sys.stderr.write('Cannot follow {}: ({}) {}\n'.format(path,err.status_code,err.message))
+   threads = [threading.Thread(target=follow,args=(path,),daemon=True) for path in offsets]
+   for thread in threads:
+      thread.start()
+   try:
+      while any(thread.is_alive() for thread in threads):
+         for thread in threads:
+            thread.join(0.5)
+   except KeyboardInterrupt:
+      pass
+
 def hdfs_download_command(client,argv):
    dlparser = argparse.ArgumentParser(prog='pyox hdfs download',description="download")
    dlparser.add_argument(
@@ -103,6 +345,30 @@ def hdfs_download_command(client,argv):
       type=int,
       metavar=('int'),
       help="The chunk size for the download")
+   dlparser.add_argument(
+      '-w','--workers',
+      dest='workers',
+      type=int,
+      metavar=('int'),
+      help="Download chunks in parallel with the number of workers")
+   dlparser.add_argument(
+      '--resume',
+      action='store_true',
+      dest='resume',
+      default=False,
+      help="Resume a partial parallel download")
+   dlparser.add_argument(
+      '--checksum',
+      action='store_true',
+      dest='checksum',
+      default=False,
+      help="Verify the download against the file checksum")
+   dlparser.add_argument(
+      '--decompress',
+      action='store_true',
+      dest='decompress',
+      default=False,
+      help="Decompress the file (gzip, zstd or lz4, detected from the data)")
    dlparser.add_argument(
       '-o','--output',
       dest='output',
@@ -122,7 +388,31 @@ def hdfs_download_command(client,argv):
    if destination is None:
       last = args.source.rfind('/')
       destination = args.source[last+1:] if last>=0 else args.source
-   if args.chunk_size is not None:
+      if args.decompress and method_for_path(destination) is not None:
+         destination = destination[0:destination.rfind('.')]
+   if args.decompress:
+      if args.workers is not None or args.resume or args.checksum or args.chunk_size is not None:
+         dlparser.error('--decompress cannot be used with --chunk-size, --workers, --resume or --checksum')
+      input = decompress_stream(threaded(client.open(args.source)))
+      with open(destination,'wb') as output:
+         for chunk in input:
+            output.write(chunk)
+   elif args.workers is not None or args.resume or args.checksum:
+      def progress(offset,length):
+         if args.verbose:
+            sys.stderr.write('Downloaded {} bytes at {}\n'.format(length,offset))
+            sys.stderr.flush()
+      info = client.download(
+         args.source,
+         destination,
+         chunk_size=args.chunk_size if args.chunk_size is not None else 8388608,
+         workers=args.workers if args.workers is not None else 4,
+         resume=args.resume,
+         verify=args.checksum,
+         progress=progress)
+      if args.verbose:
+         sys.stderr.write('File size: {}\n'.format(info['length']))
+   elif args.chunk_size is not None:
       info = client.status(args.source)
       remaining = info['length']
       offset = 0
@@ -163,11 +453,97 @@ def hdfs_mkdir_command(client,argv):
       if not client.make_directory(path):
          raise ServiceError(403,'mkdir failed: {}'.format(path))
 
+def expand_paths(client,patterns,workers=8):
+   """Expands remote glob patterns concurrently, reporting the patterns that match nothing."""
+   paths = []
+   with ThreadPoolExecutor(max_workers=min(workers,max(len(patterns),1))) as executor:
+      for pattern,matches in zip(patterns,executor.map(lambda pattern : client.glob(pattern,workers=workers),patterns)):
+         if len(matches)==0:
+            sys.stderr.write('Nothing matched {}\n'.format(pattern))
+         paths += matches
+   return paths
+
+def run_operations(operations,workers,verbose=False):
+   """Runs (description,function) operations on a pool of workers, reporting the
+   result of each one, and returns the number that failed."""
+   failed = 0
+   with ThreadPoolExecutor(max_workers=workers) as executor:
+      futures = {executor.submit(function) : description for description,function in operations}
+      for future in as_completed(futures):
+         description = futures[future]
+         try:
+            succeeded = future.result()
+            error = None
+         except ServiceError as err:
+            succeeded = False
+            error = err.message
+         except IOError as err:
+            # e.g., a connection reset or a timeout only fails this path
+            succeeded = False
+            error = str(err)
+         if not succeeded:
+            failed += 1
+            sys.stderr.write('FAILED {}{}\n'.format(description,': '+error if error is not None else ''))
+         elif verbose:
+            sys.stdout.write('{}\n'.format(description))
+   return failed
+
 def hdfs_mv_command(client,argv):
-   if len(argv)!=3:
-      sys.stderr.write('Invalid number of arguments: {}'.format(len(args.command)-1))
-   if not client.mv(argv[0],argv[1]):
-      raise ServiceError(403,'Move failed: {} → {}'.format(argv[0],argv[1]))
+   mvparser = argparse.ArgumentParser(prog='pyox hdfs mv',description="mv")
+   mvparser.add_argument(
+      '-n','--dry-run',
+      action='store_true',
+      dest='dry_run',
+      default=False,
+      help="Only show the moves")
+   mvparser.add_argument(
+      '-v',
+      action='store_true',
+      dest='verbose',
+      default=False,
+      help="Report every path moved")
+   mvparser.add_argument(
+      '-w','--workers',
+      dest='workers',
+      type=int,
+      default=8,
+      metavar=('int'),
+      help="The number of concurrent operations")
+   mvparser.add_argument(
+      'paths',
+      nargs='*',
+      help='the sources (glob patterns) and the destination')
+   args = mvparser.parse_args(argv)
+   if len(args.paths)<2:
+      mvparser.error('At least two paths must be specified.')
+   destination = args.paths[-1]
+   sources = args.paths[:-1]
+   if len(sources)==1 and not has_magic(sources[0]):
+      if args.dry_run:
+         sys.stdout.write('{} → {}\n'.format(sources[0],destination))
+      elif not client.move(sources[0],destination):
+         raise ServiceError(403,'Move failed: {} → {}'.format(sources[0],destination))
+      return
+
+   # many sources are moved into the destination directory
+   destination = destination if destination[-1]=='/' else destination + '/'
+   operations = []
+   targets = set()
+   for source in collapse_paths(expand_paths(client,sources,workers=args.workers)):
+      target = destination + source[source.rfind('/')+1:]
+      if target in targets:
+         raise ServiceError(400,'More than one source would be moved to {}'.format(target))
+      targets.add(target)
+      operations.append(('{} → {}'.format(source,target),lambda source=source,target=target : client.move(source,target)))
+   if args.dry_run:
+      for description,operation in operations:
+         sys.stdout.write(description+'\n')
+      return
+   if len(operations)>0 and not client.make_directory(destination):
+      raise ServiceError(403,'Cannot make directory {}'.format(destination))
+   failed = run_operations(operations,args.workers,verbose=args.verbose)
+   if failed>0:
+      raise ServiceError(403,'{} of {} moves failed'.format(failed,len(operations)))
 
 def hdfs_rm_command(client,argv):
    rmparser = argparse.ArgumentParser(prog='pyox hdfs rm',description="rm")
@@ -177,16 +553,50 @@ def hdfs_rm_command(client,argv):
       dest='recursive',
       default=False,
       help="Recursively remove files/directories")
+   rmparser.add_argument(
+      '-n','--dry-run',
+      action='store_true',
+      dest='dry_run',
+      default=False,
+      help="Only show the paths that would be removed")
+   rmparser.add_argument(
+      '-v',
+      action='store_true',
+      dest='verbose',
+      default=False,
+      help="Report every path removed")
+   rmparser.add_argument(
+      '-w','--workers',
+      dest='workers',
+      type=int,
+      default=8,
+      metavar=('int'),
+      help="The number of concurrent operations")
    rmparser.add_argument(
       'paths',
       nargs='*',
-      help='a list of paths')
+      help='a list of paths (glob patterns)')
    rmargs = rmparser.parse_args(argv)
-   for path in rmargs.paths:
-      if not client.remove(path,recursive=rmargs.recursive):
-         raise ServiceError(403,'Cannot remove: {}'.format(path))
+   paths = expand_paths(client,rmargs.paths,workers=rmargs.workers)
+   # a recursive removal of a directory covers everything below it
+   paths = collapse_paths(paths) if rmargs.recursive else sorted(set(paths))
+   if rmargs.dry_run:
+      for path in paths:
+         sys.stdout.write(path+'\n')
+      return
+   operations = [(path,lambda path=path : client.remove(path,recursive=rmargs.recursive)) for path in paths]
+   failed = run_operations(operations,rmargs.workers,verbose=rmargs.verbose)
+   if failed>0:
+      raise ServiceError(403,'Cannot remove {} of {} paths'.format(failed,len(paths)))
 
-def copy_to_destination(client,source,destpath,verbose=False,force=False):
+def compressed_blocks(input,method,block_size=None):
+   """Reads and compresses a file in a separate thread, yielding the compressed blocks."""
+   block_size = block_size if block_size is not None else DEFAULT_BLOCK_SIZE
+   return threaded(compress_stream(iter(lambda : input.read(block_size),b''),method))
+
+def copy_to_destination(client,source,destpath,verbose=False,force=False,mkdirs=None,block_size=None,compress=None):
+   if mkdirs is None:
+      mkdirs = tracker()
    size = os.path.getsize(source)
    targetpath = source
    slash = source.rfind('/')
@@ -196,32 +606,40 @@ def copy_to_destination(client,source,destpath,verbose=False,force=False):
       targetpath = source[slash+1:]
    elif slash > 0 :
       dirpath = source[0:slash]
-      if dirpath not in mkdirs.values:
-         if cpargs.verbose:
+      def make_directory(dirpath):
+         if verbose:
             sys.stderr.write(dirpath+'/\n')
-         if client.make_directory(destpath+dirpath):
-            mkdirs.add(dirpath)
-         else:
-            raise ServiceError(403,'Cannot make target directory: {}'.format(dirpath))
+         return client.make_directory(destpath+dirpath)
+      if not mkdirs.ensure(dirpath,make_directory):
+         raise ServiceError(403,'Cannot make target directory: {}'.format(dirpath))
 
    target = destpath + targetpath
+   if compress is not None:
+      target += EXTENSIONS[compress]
 
    if verbose:
       sys.stderr.write(source+' → '+target+'\n')
    with open(source,'rb') as input:
-      def chunker():
-         sent =0
-         while True:
-            b = input.read(32768)
-            sent += len(b)
-            if not b:
-               if cpargs.verbose:
-                  sys.stderr.write('Sent {} bytes\n'.format(sent))
-               break
-            yield b
-      if not client.copy(chunker() if size<0 else input,target,size=size,overwrite=force):
+      data = input if compress is None else compressed_blocks(input,compress,block_size)
+      if not client.copy(data,target,size=size if compress is None else -1,overwrite=force,block_size=block_size):
          raise ServiceError(403,'Move failed: {} → {}'.format(source,target))
+   return size
 
+def copy_files_to_destination(client,sources,destpath,workers=4,verbose=False,force=False,block_size=None,compress=None):
+   """Uploads the sources with a bounded pool of workers and returns the number of bytes sent."""
+   mkdirs = tracker()
+   total = 0
+   with ThreadPoolExecutor(max_workers=workers) as executor:
+      pending = set()
+      for source in sources:
+         if len(pending)>=workers*2:
+            done, pending = wait(pending,return_when=FIRST_COMPLETED)
+            for future in done:
+               total += future.result()
+         pending.add(executor.submit(copy_to_destination,client,source,destpath,verbose=verbose,force=force,mkdirs=mkdirs,block_size=block_size,compress=compress))
+      for future in pending:
+         total += future.result()
+   return total
 
 def hdfs_cp_command(client,argv):
    cpparser = argparse.ArgumentParser(prog='pyox hdfs cp',description="cp")
@@ -249,6 +667,35 @@ def hdfs_cp_command(client,argv):
       dest='sendsize',
       default=False,
       help="Send the file size")
+   cpparser.add_argument(
+      '-w','--workers',
+      dest='workers',
+      type=int,
+      default=4,
+      metavar=('int'),
+      help="The number of files to upload concurrently")
+   cpparser.add_argument(
+      '--block-size',
+      dest='block_size',
+      type=int,
+      metavar=('int'),
+      help="The size of the blocks read and sent (defaults to 1MB)")
+   cpparser.add_argument(
+      '--part-size',
+      dest='part_size',
+      type=int,
+      metavar=('int'),
+      help="Upload a single file in parts of this size sent concurrently by the workers")
+   cpparser.add_argument(
+      '--resume',
+      action='store_true',
+      dest='resume',
+      default=False,
+      help="Upload a single file with checkpoints (every --part-size bytes) and resume an interrupted upload")
+   cpparser.add_argument(
+      '--compress',
+      choices=list(EXTENSIONS.keys()),
+      help="Compress the files while they are sent (files copied to a directory get the extension of the method)")
    cpparser.add_argument(
       'paths',
       nargs='*',
@@ -258,38 +705,492 @@ def hdfs_cp_command(client,argv):
       sys.stderr.write('At least two paths must be specified.\n')
       sys.exit(1)
    destpath = cpargs.paths[-1]
+   if cpargs.compress is not None and (cpargs.resume or cpargs.part_size is not None):
+      cpparser.error('--compress cannot be used with --resume or --part-size')
    if destpath[-1]=='/':
       # directory copy, glob files
-      mkdirs = tracker()
-      for pattern in cpargs.paths[:-1]:
-         if isfile(pattern):
-            copy_to_destination(client,pattern,destpath,verbose=cpargs.verbose,force=cpargs.force)
-         else:
-            files = glob(pattern,recursive=cpargs.recursive)
-            if len(files)==0 and cpargs.verbose:
-               sys.stderr.write('Nothing matched {}\n'.format(pattern))
-            for source in files:
-               copy_to_destination(client,source,destpath,verbose=cpargs.verbose,force=cpargs.force)
+      def sources():
+         for pattern in cpargs.paths[:-1]:
+            if isfile(pattern):
+               yield pattern
+            else:
+               files = glob(pattern,recursive=cpargs.recursive)
+               if len(files)==0 and cpargs.verbose:
+                  sys.stderr.write('Nothing matched {}\n'.format(pattern))
+               for source in files:
+                  if isfile(source):
+                     yield source
+      start = time.time()
+      total = copy_files_to_destination(client,sources(),destpath,workers=cpargs.workers,verbose=cpargs.verbose,force=cpargs.force,block_size=cpargs.block_size,compress=cpargs.compress)
+      if cpargs.verbose:
+         elapsed = time.time() - start
+         sys.stderr.write('Sent {} bytes in {:0.1f}s ({:0.2f} MB/s)\n'.format(total,elapsed,total/1048576/elapsed if elapsed>0 else 0))
 
    elif len(cpargs.paths)==2:
       source = cpargs.paths[0]
-      size = os.path.getsize(source) if cpargs.sendsize else -1
-      with open(source,'rb') as input:
+      size = os.path.getsize(source) if cpargs.sendsize and source!='-' else -1
+      progress = None
+      if cpargs.verbose:
+         start = time.time()
+         def progress(sent,total):
+            elapsed = time.time() - start
+            sys.stderr.write('\rSent {} bytes ({:0.2f} MB/s)'.format(sent,sent/1048576/elapsed if elapsed>0 else 0))
+      if cpargs.resume and source!='-':
+         if cpargs.verbose:
+            sys.stderr.write(source+' → '+destpath+'\n')
+         client.resumable_upload(source,destpath,checkpoint_size=cpargs.part_size if cpargs.part_size is not None else 134217728,overwrite=cpargs.force,block_size=cpargs.block_size,progress=progress)
+         if cpargs.verbose:
+            sys.stderr.write('\n')
+         return
+      if cpargs.part_size is not None and source!='-':
+         if cpargs.verbose:
+            sys.stderr.write(source+' → '+destpath+'\n')
+         client.upload(source,destpath,part_size=cpargs.part_size,workers=cpargs.workers,overwrite=cpargs.force,block_size=cpargs.block_size,progress=progress)
+         if cpargs.verbose:
+            sys.stderr.write('\n')
+         return
+      # - uploads the standard input
+      with open(source,'rb') if source!='-' else sys.stdin.buffer as input:
          if cpargs.verbose:
             sys.stderr.write(source+' → '+destpath+'\n')
-         if not client.copy(input,destpath,size=size,overwrite=cpargs.force):
+         data = input
+         if cpargs.compress is not None:
+            data = compressed_blocks(input,cpargs.compress,cpargs.block_size)
+            size = -1
+         if not client.copy(data,destpath,size=size,overwrite=cpargs.force,block_size=cpargs.block_size,progress=progress):
             raise ServiceError(403,'Move failed: {} → {}'.format(source,destpath))
+         if cpargs.verbose:
+            sys.stderr.write('\n')
 
    else:
       raise ServiceError(400,'Target is not a directory.')
 
+def remote_root(path):
+   """Returns a remote directory as an absolute path without a trailing slash."""
+   return absolute_path(path).rstrip('/') or '/'
+
+def remote_tree(client,path,workers=8,missing_ok=True):
+   """Returns the files (relative paths to statuses) and directories below a remote path.
+
+   A missing path is an empty tree when missing_ok or otherwise raises the 404.
+   """
+   path = remote_root(path)
+   # the walk yields absolute paths
+   prefix = path if path=='/' else path + '/'
+   files = {}
+   directories = set()
+   # only a missing root is an empty tree
+   try:
+      client.status(path)
+   except ServiceError as err:
+      if err.status_code==404 and missing_ok:
+         return files,directories
+      raise
+   def abort(err):
+      # a directory that cannot be listed would otherwise be planned as empty
+      raise ServiceError(err.status_code,'Cannot list the remote tree {}: {}'.format(path,err.message),err.request)
+   for entry_path,info in client.iter_tree(path,workers=workers,onerror=abort):
+      relative = entry_path[len(prefix):]
+      if relative=='':
+         # the root itself (e.g., a file) is never transferred or deleted
+         continue
+      if info.is_directory:
+         directories.add(relative)
+      else:
+         files[relative] = info
+   return files,directories
+
+def local_tree(path):
+   """Returns the files (relative paths to os.stat results) and directories below a local path."""
+   files = {}
+   directories = set()
+   for dirpath,dirnames,filenames in os.walk(path):
+      for name in dirnames:
+         directories.add(os.path.relpath(os.path.join(dirpath,name),path).replace(os.sep,'/'))
+      for name in filenames:
+         full = os.path.join(dirpath,name)
+         if isfile(full):
+            files[os.path.relpath(full,path).replace(os.sep,'/')] = os.stat(full)
+   return files,directories
+
+def sync_plan(client,local,remote,download=False,checksum=False,delete=False,workers=8):
+   """Compares a local and a remote directory and returns the files to transfer,
+   as (relative path,source status) tuples, and the relative paths of the files
+   and directories to delete.
+
+   Files differ when their sizes or modification times (in milliseconds) differ
+   or, with checksum, when their HDFS checksums differ.
+   """
+   remote = remote_root(remote)
+   local_files,local_directories = local_tree(local)
+   # a missing source is an error as everything in the target would be deleted
+   remote_files,remote_directories = remote_tree(client,remote,workers=workers,missing_ok=not download)
+   sources,targets = (remote_files,local_files) if download else (local_files,remote_files)
+
+   def modification_time(info):
+      return info.modification_time if not isinstance(info,os.stat_result) else info.st_mtime_ns//1000000
+   def size(info):
+      return info.length if not isinstance(info,os.stat_result) else info.st_size
+
+   transfers = []
+   same = []
+   for relative in sorted(sources):
+      target = targets.get(relative)
+      if target is None or size(target)!=size(sources[relative]):
+         transfers.append(relative)
+      elif checksum or modification_time(target)!=modification_time(sources[relative]):
+         same.append(relative)
+
+   if checksum and len(same)>0:
+      def differs(relative):
+         remote_path = join_remote(remote,relative)
+         remote_checksum = client.checksum(remote_path)
+         actual = local_checksum(os.path.join(local,relative),remote_checksum['algorithm'],remote_files[relative].block_size)
+         return relative,actual!=remote_checksum['bytes'][-32:]
+      with ThreadPoolExecutor(max_workers=workers) as executor:
+         transfers += [relative for relative,changed in executor.map(differs,same) if changed]
+   else:
+      # the same size with another modification time
+      transfers += same
+   transfers = [(relative,sources[relative]) for relative in sorted(transfers)]
+
+   deletions = []
+   if delete:
+      source_directories,target_directories = (remote_directories,local_directories) if download else (local_directories,remote_directories)
+      extraneous = sorted(target_directories - source_directories)
+      for directory in extraneous:
+         # only the topmost extraneous directories are removed
+         parent = directory[0:directory.rfind('/')] if '/' in directory else None
+         if parent is None or parent not in extraneous:
+            deletions.append(directory)
+      for relative in sorted(targets):
+         if relative not in sources and not any(relative.startswith(directory+'/') for directory in deletions):
+            deletions.append(relative)
+   return transfers,deletions
+
+def join_remote(path,relative):
+   return path + relative if path[-1]=='/' else path + '/' + relative
+
+def sync_upload(client,local,remote,relative,info,mkdirs):
+   source = os.path.join(local,relative)
+   target = join_remote(remote,relative)
+   slash = target.rfind('/')
+   if slash>0 and not mkdirs.ensure(target[0:slash],client.make_directory):
+      raise ServiceError(403,'Cannot make target directory: {}'.format(target[0:slash]))
+   with open(source,'rb') as input:
+      client.copy(input,target,size=info.st_size,overwrite=True)
+   # the modification time is how the next sync finds the file unchanged
+   client.set_times(target,modification_time=info.st_mtime_ns//1000000)
+   return info.st_size
+
+def sync_download(client,remote,local,relative,info):
+   target = os.path.join(local,relative)
+   os.makedirs(os.path.dirname(target),exist_ok=True)
+   partial = target + '.sync'
+   with open(partial,'wb') as output:
+      for chunk in client.open(join_remote(remote,relative)):
+         output.write(chunk)
+   os.utime(partial,ns=(info.modification_time*1000000,info.modification_time*1000000))
+   os.replace(partial,target)
+   return info.length
+
+def hdfs_sync_command(client,argv):
+   syncparser = argparse.ArgumentParser(prog='pyox hdfs sync',description="sync")
+   syncparser.add_argument(
+      '-d','--download',
+      action='store_true',
+      dest='download',
+      default=False,
+      help="Synchronize the local directory from the remote directory")
+   syncparser.add_argument(
+      '--delete',
+      action='store_true',
+      dest='delete',
+      default=False,
+      help="Delete files and directories that are not in the source")
+   syncparser.add_argument(
+      '-c','--checksum',
+      action='store_true',
+      dest='checksum',
+      default=False,
+      help="Compare files with the same size by checksum instead of modification time")
+   syncparser.add_argument(
+      '-n','--dry-run',
+      action='store_true',
+      dest='dry_run',
+      default=False,
+      help="Only show what would be transferred and deleted")
+   syncparser.add_argument(
+      '-w','--workers',
+      dest='workers',
+      type=int,
+      default=4,
+      metavar=('int'),
+      help="The number of files to transfer concurrently")
+   syncparser.add_argument(
+      '-v',
+      action='store_true',
+      dest='verbose',
+      default=False,
+      help="Verbose")
+   syncparser.add_argument(
+      'source',
+      help='the source directory (local, or remote with --download)')
+   syncparser.add_argument(
+      'destination',
+      help='the destination directory (remote, or local with --download)')
+   args = syncparser.parse_args(argv)
+
+   local,remote = (args.destination,args.source) if args.download else (args.source,args.destination)
+   remote = remote_root(remote)
+   if not args.download and not os.path.isdir(local):
+      syncparser.error('{} is not a directory'.format(local))
+   start = time.time()
+   transfers,deletions = sync_plan(client,local,remote,download=args.download,checksum=args.checksum,delete=args.delete,workers=args.workers*2)
+   if args.dry_run or args.verbose:
+      for relative,info in transfers:
+         sys.stdout.write('{} {}\n'.format('download' if args.download else 'upload',relative))
+      for relative in deletions:
+         sys.stdout.write('delete {}\n'.format(relative))
+   if args.dry_run:
+      return
+
+   total = 0
+   if len(transfers)>0:
+      with ThreadPoolExecutor(max_workers=args.workers) as executor:
+         if args.download:
+            futures = [executor.submit(sync_download,client,remote,local,relative,info) for relative,info in transfers]
+         else:
+            mkdirs = tracker()
+            futures = [executor.submit(sync_upload,client,local,remote,relative,info,mkdirs) for relative,info in transfers]
+         for future in as_completed(futures):
+            total += future.result()
+
+   for relative in deletions:
+      if args.download:
+         target = os.path.join(local,relative)
+         if os.path.isdir(target):
+            shutil.rmtree(target)
+         else:
+            os.remove(target)
+      else:
+         client.remove(join_remote(remote,relative),recursive=True)
+
+   if args.verbose:
+      elapsed = time.time() - start
+      sys.stderr.write('Transferred {} files ({} bytes), deleted {} in {:0.1f}s\n'.format(len(transfers),total,len(deletions),elapsed))
+
+def client_settings(client):
+   """Returns the settings needed to recreate a client in another process."""
+   return {
+      'secure' : client.secure,
+      'host' : client.host,
+      'port' : client.port,
+      'gateway' : client.gateway,
+      'base' : client.base,
+      'username' : client.username,
+      'password' : client.password,
+      'cookies' : client.cookies,
+      'bearer_auth' : client.bearer_auth,
+      'proxies' : client.proxies,
+      'verify' : client.verify
+   }
+
+def client_from_settings(settings):
+   settings = dict(settings)
+   bearer_auth = settings.pop('bearer_auth')
+   proxies = settings.pop('proxies')
+   verify = settings.pop('verify')
+   # a new pool as connections inherited from a parent process cannot be shared
+   client = WebHDFS(session_pool=SessionPool(),**settings)
+   client.bearer_auth = bearer_auth
+   client.proxies = proxies
+   client.verify = verify
+   return client
+
+_grep_client = None
+_grep_regex = None
+_grep_invert = False
+
+def grep_init(settings,pattern,flags,invert):
+   global _grep_client, _grep_regex, _grep_invert
+   _grep_client = client_from_settings(settings)
+   _grep_regex = re.compile(pattern,flags)
+   _grep_invert = invert
+
+def grep_range(task):
+   """Searches the lines that start in a range of a file, returning a list of
+   (offset,line) tuples for the (non-)matching lines.
+
+   The byte before the range is read to tell whether the range starts a line;
+   the partial line at the start belongs to the previous range and the line that
+   crosses the end of the range is completed by reading past it.
+   """
+   path,start,end,size = task
+   offset = start-1 if start>0 else 0
+   data = _grep_client.read_range(path,offset,end-offset)
+   position = 0
+   if start>0:
+      position = data.find(b'\n') + 1
+      if position==0:
+         # no line starts in the range
+         return []
+   if not data.endswith(b'\n') and end<size:
+      parts = [data]
+      window = 65536
+      while end<size:
+         chunk = _grep_client.read_range(path,end,min(window,size-end))
+         newline = chunk.find(b'\n')
+         if newline>=0:
+            parts.append(chunk[0:newline+1])
+            break
+         parts.append(chunk)
+         end += len(chunk)
+         window *= 2
+      data = b''.join(parts)
+   length = len(data)
+   results = []
+   if _grep_invert:
+      while position<length:
+         line_end = data.find(b'\n',position)
+         if line_end<0:
+            line_end = length
+         if _grep_regex.search(data,position,line_end) is None:
+            results.append((offset+position,data[position:line_end]))
+         position = line_end + 1
+   else:
+      # the whole range is searched and each match is checked against its own line
+      while position<length:
+         match = _grep_regex.search(data,position)
+         if match is None:
+            break
+         line_start = max(data.rfind(b'\n',position,match.start()) + 1,position)
+         if line_start>=length:
+            # an empty match after the last newline is not a line of the range
+            break
+         line_end = data.find(b'\n',line_start)
+         if line_end<0:
+            line_end = length
+         if match.end()<=line_end or _grep_regex.search(data,line_start,line_end) is not None:
+            results.append((offset+line_start,data[line_start:line_end]))
+         position = line_end + 1
+   return results
+
+def hdfs_grep_command(client,argv):
+   grepparser = argparse.ArgumentParser(prog='pyox hdfs grep',description="Searches files for lines matching a pattern")
+   grepparser.add_argument(
+      '-i','--ignore-case',
+      action='store_true',
+      dest='ignore_case',
+      default=False,
+      help="Ignore case distinctions")
+   grepparser.add_argument(
+      '-v','--invert-match',
+      action='store_true',
+      dest='invert',
+      default=False,
+      help="Select the lines that do not match")
+   grepparser.add_argument(
+      '-F','--fixed-strings',
+      action='store_true',
+      dest='fixed',
+      default=False,
+      help="The pattern is a string instead of a regular expression")
+   grepparser.add_argument(
+      '-c','--count',
+      action='store_true',
+      dest='count',
+      default=False,
+      help="Print only the number of selected lines for each file")
+   grepparser.add_argument(
+      '-l','--files-with-matches',
+      action='store_true',
+      dest='files_with_matches',
+      default=False,
+      help="Print only the names of the files with selected lines")
+   grepparser.add_argument(
+      '--include',
+      dest='include',
+      metavar=('glob'),
+      help="Search only the files whose names match a glob")
+   grepparser.add_argument(
+      '--range-size',
+      dest='range_size',
+      type=int,
+      default=67108864,
+      metavar=('int'),
+      help="The size of the ranges of a file that are searched in parallel (defaults to 64MB)")
+   grepparser.add_argument(
+      '-p','--processes',
+      dest='processes',
+      type=int,
+      default=os.cpu_count() or 1,
+      metavar=('int'),
+      help="The number of processes searching ranges (defaults to the number of CPUs)")
+   grepparser.add_argument(
+      '-w','--workers',
+      dest='workers',
+      type=int,
+      default=8,
+      metavar=('int'),
+      help="The number of directories listed concurrently")
+   grepparser.add_argument(
+      'pattern',
+      help='a regular expression')
+   grepparser.add_argument(
+      'paths',
+      nargs='+',
+      help='a list of files or directories (glob patterns), directories are searched recursively')
+   args = grepparser.parse_args(argv)
+
+   if args.range_size<=0:
+      raise ValueError('The range size must be positive: {}'.format(args.range_size))
+
+   pattern = re.escape(args.pattern) if args.fixed else args.pattern
+   flags = re.MULTILINE | (re.IGNORECASE if args.ignore_case else 0)
+   # reports a bad pattern before starting the processes
+   re.compile(pattern.encode('utf-8'),flags)
+
+   include = lambda path,status : not status.is_directory and (args.include is None or fnmatch(status.name or path[path.rfind('/')+1:],args.include))
+   files = []
+   for path in expand_paths(client,args.paths,workers=args.workers):
+      for file_path,status in client.iter_tree(path,include=include,workers=args.workers):
+         files.append((file_path,status.length))
+
+   # the ranges are searched in parallel but reported in the order of the files
+   tasks = [(path,start,min(start+args.range_size,size),size) for path,size in files for start in range(0,size,args.range_size)]
+   counts = {path : 0 for path,size in files}
+   output = sys.stdout.buffer
+   with ProcessPoolExecutor(max_workers=max(args.processes,1),initializer=grep_init,initargs=(client_settings(client),pattern.encode('utf-8'),flags,args.invert)) as executor:
+      for task,results in zip(tasks,executor.map(grep_range,tasks)):
+         path = task[0]
+         if len(results)==0:
+            continue
+         if args.files_with_matches:
+            if counts[path]==0:
+               output.write(path.encode('utf-8')+b'\n')
+         elif not args.count:
+            prefix = path.encode('utf-8')
+            for offset,line in results:
+               output.write(b'%s:%d:%s\n' % (prefix,offset,line))
+         counts[path] += len(results)
+   if args.count:
+      for path,size in files:
+         output.write('{}:{}\n'.format(path,counts[path]).encode('utf-8'))
+   output.flush()
+
 hdfs_commands = {
    'ls' : hdfs_ls_command,
    'cat' : hdfs_cat_command,
    'download' : hdfs_download_command,
+   'du' : hdfs_du_command,
+   'grep' : hdfs_grep_command,
+   'head' : hdfs_head_command,
    'mkdir' : hdfs_mkdir_command,
    'mv' : hdfs_mv_command,
    'rm' : hdfs_rm_command,
+   'sync' : hdfs_sync_command,
+   'tail' : hdfs_tail_command,
    'upload' : hdfs_cp_command
 }
 
@@ -2,6 +2,7 @@ from pyox.client import Client, ServiceError, response_data
 from pyox.webhdfs import WebHDFS
 from io import StringIO
 from enum import auto,Enum
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import sys
 import types
 import requests
@@ -10,6 +11,7 @@ import json
 JOB_TRACKER = 'jobTracker'
 NAMENODE = 'nameNode'
 OOZIE_APP_PATH = 'oozie.wf.application.path'
+OOZIE_NOTIFICATION_URL = 'oozie.wf.workflow.notification.url'
 _jsonType = 'application/json'
 
 def property_value(workflow,properties,name):
@@ -753,6 +755,7 @@ class Oozie(Client):
       super().__init__(**kwargs)
       self.service = 'oozie'
       self.properties = {}
+      self.metadata_cache = kwargs.get('metadata_cache')
       self.defaultNamenode = kwargs.get('namenode')
       if self.defaultNamenode is None:
          self.defaultNamenode = 'sandbox'
@@ -761,10 +764,11 @@ class Oozie(Client):
          self.properties[JOB_TRACKER] = tracker
 
    def createHDFSClient(self):
-      webhdfs = WebHDFS(base=self.base,secure=self.secure,host=self.host,port=self.port,gateway=self.gateway,username=self.username,password=self.password,cookies=self.cookies)
+      webhdfs = WebHDFS(base=self.base,secure=self.secure,host=self.host,port=self.port,gateway=self.gateway,username=self.username,password=self.password,cookies=self.cookies,session_pool=self.session_pool)
       webhdfs.bearer_auth = self.bearer_auth
       webhdfs.proxies = self.proxies
       webhdfs.verify = self.verify
+      webhdfs.metadata_cache = self.metadata_cache
       if self.verbose:
          webhdfs.enable_verbose()
       return webhdfs
@@ -801,6 +805,26 @@ class Oozie(Client):
       else:
          raise ServiceError(req.status_code if req.status_code!=400 else 404,'Cannot get job information for {}'.format(jobid),request=req)
 
+   def status_many(self,jobids,show='info',max_workers=8,ordered=False):
+      """Retrieves the status of many jobs concurrently.
+
+      Yields a (jobid,info,error) tuple for every job as the responses arrive or,
+      when ordered, in the order of the job ids. A failure for one job is reported
+      as its error and does not stop the others.
+      """
+      def fetch(jobid):
+         try:
+            return (jobid,self.status(jobid,show=show),None)
+         except Exception as err:
+            return (jobid,None,err)
+      with ThreadPoolExecutor(max_workers=max_workers) as executor:
+         if ordered:
+            yield from executor.map(fetch,jobids)
+            return
+         futures = [executor.submit(fetch,jobid) for jobid in jobids]
+         for future in as_completed(futures):
+            yield future.result()
+
    def list_jobs(self,status=None,offset=0,count=50):
       url = '{}/jobs'.format(self.service_url(version='v2'))
       params = {
@@ -816,7 +840,21 @@ class Oozie(Client):
       else:
          raise ServiceError(req.status_code,'Cannot list jobs',request=req)
 
-   def submit(self,path,properties=None,workflow=None,copy=[],verbose=False,tracker=None):
+   def submit(self,path,properties=None,workflow=None,copy=[],verbose=False,tracker=None,notification_url=None):
+      """Copies the workflow and resources to the path and starts the job.
+
+      If a tracker is given, the job is tracked by it and Oozie notifies the tracker
+      when the job finishes. The notification_url overrides the URL Oozie calls;
+      $jobId and $status are replaced by Oozie.
+      """
+
+      if tracker is not None and tracker[-1]=='/':
+         tracker = tracker[0:-1]
+      if notification_url is None and tracker is not None:
+         notification_url = tracker + '/job/$jobId/notify?status=$status'
+      if notification_url is not None:
+         properties = dict(properties) if properties is not None else {}
+         properties[OOZIE_NOTIFICATION_URL] = notification_url
 
       job = self.newJob(path,verbose=verbose)
       if workflow is not None:
@@ -849,10 +887,8 @@ class Oozie(Client):
       if tracker is not None:
          if verbose or self.progress:
             sys.stderr.write('Requesting tracking of {}\n'.format(jobid))
-         if tracker[-1]=='/':
-            tracker = tracker[0:-1]
          url = tracker + '/task/track/'
-         track_req = requests.post(
+         track_req = self.session().post(
             url,
             auth=self.auth(),
             data=json.dumps({'id' : jobid}),
@@ -45,6 +45,11 @@ def oozie_start_command(client,argv):
       nargs=1,
       metavar=('node[:port]'),
       help="The job tracker for jobs")
+   cmdparser.add_argument(
+      '--notification-url',
+      dest='notification_url',
+      metavar=('url'),
+      help="The URL Oozie calls when the job finishes ($jobId and $status are replaced)")
    cmdparser.add_argument(
       '-v','--verbose',
       action='store_true',
@@ -88,9 +93,9 @@ def oozie_start_command(client,argv):
          files.append((fpath,dest))
    if args.definition is not None:
       with open(args.definition,'rb') as data:
-         jobid = client.submit(args.path,properties=properties,workflow=data,copy=files,verbose=args.verbose)
+         jobid = client.submit(args.path,properties=properties,workflow=data,copy=files,verbose=args.verbose,notification_url=args.notification_url)
    else:
-      jobid = client.submit(args.path,properties=properties,copy=files,verbose=args.verbose)
+      jobid = client.submit(args.path,properties=properties,copy=files,verbose=args.verbose,notification_url=args.notification_url)
    print(jobid)
 
 def convert_timestamp(value):
@@ -138,6 +143,13 @@ def oozie_status_command(client,argv):
       dest='detailed',
       default=False,
       help="list details")
+   cmdparser.add_argument(
+      '-w','--workers',
+      dest='workers',
+      type=int,
+      default=8,
+      metavar=('int'),
+      help="The number of concurrent status requests")
    cmdparser.add_argument(
       '-v','--verbose',
       action='store_true',
@@ -150,9 +162,20 @@ def oozie_status_command(client,argv):
       help='a list job ids')
    args = cmdparser.parse_args(argv)
 
-   for jobid in args.jobids:
+   # reported in the order of the arguments
+   for jobid,response,err in client.status_many(args.jobids,show=args.show,max_workers=args.workers,ordered=True):
+      if err is not None and not isinstance(err,ServiceError):
+         # e.g., a connection error only fails this job
+         if args.raw:
+            sys.stdout.write('\n')
+            sys.stdout.write(json.dumps({'id':jobid,'error':str(err)}))
+            sys.stdout.write('\x1e')
+         else:
+            print('{}\tERROR {}'.format(jobid,err))
+         continue
       try:
-         response = client.status(jobid,show=args.show)
+         if err is not None:
+            raise err
          if args.raw or type(response)==str:
             if type(response)==str:
                sys.stdout.write(response)
@@ -204,7 +227,7 @@ def oozie_status_command(client,argv):
                sys.stdout.write('{{"id":"{}","status":{}}}'.format(jobid,err.status_code))
                sys.stdout.write('\x1e')
             else:
-               raise
+               print('{}\tERROR ({}) {}'.format(jobid,err.status_code,err.message))
 
 def oozie_ls_command(client,argv):
    cmdparser = argparse.ArgumentParser(prog='pyox oozie status',description='job status')
@@ -1,35 +1,894 @@
 
 from pyox.client import Client, ServiceError
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from array import array
+from collections import deque, OrderedDict
+from collections.abc import Mapping
+from fnmatch import fnmatch
+from hashlib import md5
+import codecs
+import io
+import json
+import os
+import re
+import stat
+import sys
+import zlib
+from threading import Lock
+from time import monotonic, sleep
+from uuid import uuid4
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 
 def absolute_path(path):
    if len(path)>0 and path[0]!='/':
       path = '/'+path
    return path
 
+def join_path(path,name):
+   if name=='':
+      return path
+   return path + name if path[-1:]=='/' else path + '/' + name
+
+def has_magic(path):
+   return any(c in path for c in '*?[')
+
+def collapse_paths(paths):
+   """Returns the sorted unique paths without those below another path in the list."""
+   result = []
+   for path in sorted(set(paths)):
+      if len(result)>0 and (path==result[-1] or path.startswith(result[-1] if result[-1]=='/' else result[-1]+'/')):
+         continue
+      result.append(path)
+   return result
+
+def path_matcher(spec):
+   """Returns a predicate on (path,status) for a glob on the entry name or a predicate."""
+   if spec is None or callable(spec):
+      return spec
+   return lambda path,status : fnmatch(path[path.rfind('/')+1:],spec)
+
+_checksum_algorithm = re.compile(r'MD5-of-(\d+)MD5-of-(\d+)(CRC32C?)$')
+
+class JSONArrayParser:
+   """Incrementally parses the objects of the first array with a given key from
+   chunks of JSON text, so that a large response can be consumed as it arrives.
+
+   The text following the array is kept in tail.
+   """
+
+   def __init__(self,key):
+      self.start = re.compile(r'"{}"\s*:\s*\['.format(re.escape(key)))
+      self.decoder = json.JSONDecoder()
+      self.buffer = ''
+      self.in_array = False
+      self.done = False
+      self.tail = ''
+
+   def feed(self,text):
+      if self.done:
+         self.tail += text
+         return []
+      self.buffer += text
+      if not self.in_array:
+         match = self.start.search(self.buffer)
+         if match is None:
+            return []
+         self.buffer = self.buffer[match.end():]
+         self.in_array = True
+      items = []
+      pos = 0
+      length = len(self.buffer)
+      while True:
+         while pos<length and self.buffer[pos] in ' \t\r\n,':
+            pos += 1
+         if pos==length:
+            break
+         if self.buffer[pos]==']':
+            self.done = True
+            self.tail = self.buffer[pos+1:]
+            self.buffer = ''
+            return items
+         try:
+            item,pos = self.decoder.raw_decode(self.buffer,pos)
+         except ValueError:
+            # the object is incomplete
+            break
+         items.append(item)
+      self.buffer = self.buffer[pos:]
+      return items
+
+FILE_TYPES = ['FILE','DIRECTORY','SYMLINK']
+
+class FileStatus:
+   """The status of an HDFS file or directory.
+
+   The JSON field names are still available by subscript or get() (e.g.,
+   status['length']) for code written against the WebHDFS responses. The fields
+   without an attribute (e.g., fileId or childrenNum) are kept in extra and
+   to_json() returns the original fields.
+   """
+
+   __slots__ = ('name','type','length','modification_time','access_time','permission','owner','group','replication','block_size','extra')
+
+   _fields = {
+      'pathSuffix' : 'name',
+      'type' : 'type',
+      'length' : 'length',
+      'modificationTime' : 'modification_time',
+      'accessTime' : 'access_time',
+      'permission' : 'permission',
+      'owner' : 'owner',
+      'group' : 'group',
+      'replication' : 'replication',
+      'blockSize' : 'block_size'
+   }
+
+   def __init__(self,name,type,length=0,modification_time=0,access_time=0,permission='0',owner=None,group=None,replication=0,block_size=0,extra=None):
+      self.name = name
+      self.type = type
+      self.length = length
+      self.modification_time = modification_time
+      self.access_time = access_time
+      self.permission = permission
+      self.owner = owner
+      self.group = group
+      self.replication = replication
+      self.block_size = block_size
+      self.extra = extra
+
+   @classmethod
+   def from_json(cls,data):
+      return cls(
+         data['pathSuffix'],
+         sys.intern(data['type']),
+         int(data.get('length',0)),
+         int(data.get('modificationTime',0)),
+         int(data.get('accessTime',0)),
+         sys.intern(data.get('permission','0')),
+         sys.intern(data['owner']) if 'owner' in data else None,
+         sys.intern(data['group']) if 'group' in data else None,
+         int(data.get('replication',0)),
+         int(data.get('blockSize',0)),
+         {key : value for key,value in data.items() if key not in cls._fields} or None)
+
+   @property
+   def is_directory(self):
+      return self.type=='DIRECTORY'
+
+   def __getitem__(self,key):
+      name = FileStatus._fields.get(key)
+      if name is not None:
+         return getattr(self,name)
+      if self.extra is not None and key in self.extra:
+         return self.extra[key]
+      raise KeyError(key)
+
+   def __contains__(self,key):
+      return key in FileStatus._fields or (self.extra is not None and key in self.extra)
+
+   def get(self,key,default=None):
+      try:
+         return self[key]
+      except KeyError:
+         return default
+
+   def to_json(self):
+      data = {key : getattr(self,name) for key,name in FileStatus._fields.items()}
+      if self.extra is not None:
+         data.update(self.extra)
+      return data
+
+   def __eq__(self,other):
+      return isinstance(other,FileStatus) and all(getattr(self,name)==getattr(other,name) for name in FileStatus.__slots__)
+
+   def __repr__(self):
+      return 'FileStatus({!r},{!r},length={})'.format(self.name,self.type,self.length)
+
+def _head_end(data,lines):
+   # the position after the last of the first lines or -1 when data has fewer lines
+   end = 0
+   for i in range(lines):
+      end = data.find(b'\n',end) + 1
+      if end==0:
+         return -1
+   return end
+
+def _tail_start(data,lines):
+   # the position of the first of the last lines or -1 when data has fewer lines
+   start = len(data)-1 if data.endswith(b'\n') else len(data)
+   for i in range(lines):
+      start = data.rfind(b'\n',0,start)
+      if start<0:
+         return -1
+   return start+1 if lines>0 else len(data)
+
+class DirectoryListing(Mapping):
+   """A directory listing stored as columns of names, types, sizes, times and
+   permissions instead of a status object per entry.
+
+   The listing is a mapping of names to FileStatus objects (created on access)
+   so it can be used like the dictionary list_directory used to return, and
+   to_json() returns that dictionary (e.g., for serialisation). The columns
+   can be used directly and sort() and filter() work on them without creating
+   the status objects.
+   """
+
+   def __init__(self,statuses=None):
+      self.names = []
+      self.types = bytearray()
+      self.lengths = array('q')
+      self.modification_times = array('q')
+      self.access_times = array('q')
+      self.permissions = array('H')
+      self.owners = []
+      self.groups = []
+      self.replications = array('H')
+      self.block_sizes = array('q')
+      # the fields without a column, mostly None
+      self.extras = []
+      self._index = None
+      if statuses is not None:
+         for status in statuses:
+            self.append(status)
+
+   def append(self,status):
+      self.names.append(status.name)
+      self.types.append(FILE_TYPES.index(status.type) if status.type in FILE_TYPES else 0)
+      self.lengths.append(status.length)
+      self.modification_times.append(status.modification_time)
+      self.access_times.append(status.access_time)
+      self.permissions.append(int(status.permission,8))
+      self.owners.append(status.owner)
+      self.groups.append(status.group)
+      self.replications.append(status.replication)
+      self.block_sizes.append(status.block_size)
+      self.extras.append(status.extra)
+      self._index = None
+
+   def status(self,index):
+      """Returns the FileStatus of the entry at a position."""
+      return FileStatus(
+         self.names[index],
+         FILE_TYPES[self.types[index]],
+         self.lengths[index],
+         self.modification_times[index],
+         self.access_times[index],
+         '{:o}'.format(self.permissions[index]),
+         self.owners[index],
+         self.groups[index],
+         self.replications[index],
+         self.block_sizes[index],
+         self.extras[index])
+
+   def is_directory(self,index):
+      return self.types[index]==1
+
+   def __len__(self):
+      return len(self.names)
+
+   def __iter__(self):
+      return iter(self.names)
+
+   def __contains__(self,name):
+      return name in self.index()
+
+   def __getitem__(self,name):
+      return self.status(self.index()[name])
+
+   def to_json(self):
+      """Returns the listing as a dictionary of names to the JSON statuses."""
+      return {self.names[i] : self.status(i).to_json() for i in range(len(self.names))}
+
+   def index(self):
+      if self._index is None:
+         self._index = {name : position for position,name in enumerate(self.names)}
+      return self._index
+
+   def _select(self,positions):
+      listing = DirectoryListing()
+      listing.names = [self.names[i] for i in positions]
+      listing.types = bytearray(self.types[i] for i in positions)
+      listing.lengths = array('q',(self.lengths[i] for i in positions))
+      listing.modification_times = array('q',(self.modification_times[i] for i in positions))
+      listing.access_times = array('q',(self.access_times[i] for i in positions))
+      listing.permissions = array('H',(self.permissions[i] for i in positions))
+      listing.owners = [self.owners[i] for i in positions]
+      listing.groups = [self.groups[i] for i in positions]
+      listing.replications = array('H',(self.replications[i] for i in positions))
+      listing.block_sizes = array('q',(self.block_sizes[i] for i in positions))
+      listing.extras = [self.extras[i] for i in positions]
+      return listing
+
+   def sort(self,key='name',reverse=False):
+      """Returns a new listing sorted by a column: name, type, length,
+      modification_time or access_time."""
+      column = {
+         'name' : self.names,
+         'type' : self.types,
+         'length' : self.lengths,
+         'modification_time' : self.modification_times,
+         'access_time' : self.access_times
+      }[key]
+      return self._select(sorted(range(len(self.names)),key=column.__getitem__,reverse=reverse))
+
+   def filter(self,name=None,type=None,min_length=None,max_length=None,modified_after=None,modified_before=None):
+      """Returns a new listing of the entries matching all of the criteria, where
+      name is a glob and the times are in milliseconds since the epoch."""
+      type = FILE_TYPES.index(type) if type is not None else None
+      positions = []
+      for i in range(len(self.names)):
+         if type is not None and self.types[i]!=type:
+            continue
+         if min_length is not None and self.lengths[i]<min_length:
+            continue
+         if max_length is not None and self.lengths[i]>max_length:
+            continue
+         if modified_after is not None and self.modification_times[i]<=modified_after:
+            continue
+         if modified_before is not None and self.modification_times[i]>=modified_before:
+            continue
+         if name is not None and not fnmatch(self.names[i],name):
+            continue
+         positions.append(i)
+      return self._select(positions)
+
+class _NotFound:
+   """The cached status of a path that does not exist."""
+   __slots__ = ('request',)
+
+   def __init__(self,request):
+      self.request = request
+
+class MetadataCache:
+   """A thread safe cache of file statuses and directory listings.
+
+   Entries expire after ttl seconds and the least recently used entries are
+   evicted beyond maxsize. The WebHDFS client invalidates the affected paths
+   when it changes them, but changes made by others are only seen once the
+   entries expire.
+   """
+
+   def __init__(self,ttl=30,maxsize=4096):
+      self.ttl = ttl
+      self.maxsize = maxsize
+      self.entries = OrderedDict()
+      self.lock = Lock()
+      self.hits = 0
+      self.misses = 0
+      self.evictions = 0
+      self.invalidations = 0
+
+   def get(self,kind,path):
+      """Returns the cached value or None."""
+      key = (kind,path)
+      with self.lock:
+         entry = self.entries.get(key)
+         if entry is not None:
+            if entry[0]>monotonic():
+               self.entries.move_to_end(key)
+               self.hits += 1
+               return entry[1]
+            del self.entries[key]
+         self.misses += 1
+         return None
+
+   def put(self,kind,path,value):
+      key = (kind,path)
+      with self.lock:
+         self.entries[key] = (monotonic()+self.ttl,value)
+         self.entries.move_to_end(key)
+         while len(self.entries)>self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+   def invalidate(self,path,recursive=False,ancestors=False):
+      """Removes the entries for a path and its parent directory, and optionally
+      for everything below the path or for all of its ancestors."""
+      paths = {path}
+      parent = path
+      while parent!='/':
+         parent = parent[0:parent.rfind('/')] or '/'
+         paths.add(parent)
+         if not ancestors:
+            break
+      prefix = path + '/' if path!='/' else '/'
+      with self.lock:
+         for key in list(self.entries):
+            if key[1] in paths or (recursive and key[1].startswith(prefix)):
+               del self.entries[key]
+               self.invalidations += 1
+
+   def clear(self):
+      with self.lock:
+         self.entries.clear()
+
+   def stats(self):
+      with self.lock:
+         return {
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'evictions' : self.evictions,
+            'invalidations' : self.invalidations,
+            'size' : len(self.entries)
+         }
+
+DEFAULT_BLOCK_SIZE = 1048576
+
+class UploadStream:
+   """Adapts a readable or an iterable of bytes (or str) to the blocks of an upload.
+
+   Readables are read in blocks of block_size bytes. Binary readables are read
+   with readinto() into a single reused buffer and, when the size is known, the
+   blocks are sent as memoryviews of that buffer without copying. Iterables are
+   coalesced into blocks of at least block_size bytes. The progress callback
+   receives the number of bytes sent so far and the size (-1 if unknown).
+
+   When the size is not given it is taken from regular files; otherwise the
+   upload uses chunked transfer encoding.
+   """
+
+   def __init__(self,data,size=-1,block_size=DEFAULT_BLOCK_SIZE,progress=None):
+      self.data = data
+      self.block_size = block_size if block_size is not None else DEFAULT_BLOCK_SIZE
+      self.progress = progress
+      if size<0 and hasattr(data,'fileno') and hasattr(data,'tell'):
+         try:
+            info = os.fstat(data.fileno())
+            if stat.S_ISREG(info.st_mode):
+               size = info.st_size - data.tell()
+         except (OSError,ValueError):
+            pass
+      self.size = size
+
+   def __len__(self):
+      # requests uses the length for the Content-Length header and chunked
+      # transfer encoding when it is zero
+      return self.size if self.size>0 else 0
+
+   def __bool__(self):
+      # a stream is never an empty body, whatever its length
+      return True
+
+   def __iter__(self):
+      if hasattr(self.data,'readinto'):
+         blocks = self._readinto_blocks()
+      elif hasattr(self.data,'read'):
+         blocks = self._read_blocks()
+      else:
+         blocks = self._coalesce_blocks()
+      sent = 0
+      for block in blocks:
+         sent += len(block)
+         yield block
+         if self.progress is not None:
+            self.progress(sent,self.size)
+
+   def _readinto_blocks(self):
+      buffer = bytearray(self.block_size)
+      view = memoryview(buffer)
+      remaining = self.size
+      while remaining!=0:
+         count = self.data.readinto(view if remaining<0 or remaining>=self.block_size else view[0:remaining])
+         if not count:
+            break
+         if remaining>0:
+            remaining -= count
+         # the buffer is reused and so can only be handed out when the block is
+         # sent before the next one is read (i.e., not for chunked encoding)
+         yield view[0:count] if self.size>0 else bytes(view[0:count])
+
+   def _read_blocks(self):
+      while True:
+         block = self.data.read(self.block_size)
+         if not block:
+            break
+         yield block.encode('utf-8') if isinstance(block,str) else block
+
+   def _coalesce_blocks(self):
+      buffer = bytearray()
+      for chunk in self.data:
+         if isinstance(chunk,str):
+            chunk = chunk.encode('utf-8')
+         if len(buffer)==0 and len(chunk)>=self.block_size:
+            yield chunk
+            continue
+         buffer += chunk
+         if len(buffer)>=self.block_size:
+            yield bytes(buffer)
+            buffer.clear()
+      if len(buffer)>0:
+         yield bytes(buffer)
+
+def upload_body(data,size=-1,block_size=None,progress=None):
+   """Returns bytes as they are and wraps anything else in an UploadStream."""
+   if isinstance(data,(bytes,bytearray)):
+      if progress is not None:
+         progress(len(data),len(data))
+      return data
+   if isinstance(data,str):
+      return upload_body(data.encode('utf-8'),size=size,progress=progress)
+   stream = UploadStream(data,size=size,block_size=block_size,progress=progress)
+   return stream if stream.size!=0 else b''
+
+class WebHDFSReader(io.RawIOBase):
+   """A seekable, read-only raw stream over an HDFS file.
+
+   The file is read in blocks of block_size bytes with ranged OPEN requests.
+   The most recently used cache_blocks blocks are kept and, when the file is
+   read sequentially, the next prefetch blocks are fetched in the background.
+   """
+
+   def __init__(self,client,path,block_size=4194304,cache_blocks=16,prefetch=2,length=None):
+      super().__init__()
+      self.client = client
+      self.path = path
+      self.block_size = block_size
+      self.cache_blocks = max(cache_blocks,prefetch+1)
+      self.prefetch = prefetch
+      self.length = length if length is not None else client.status(path)['length']
+      self.position = 0
+      self.blocks = OrderedDict()
+      self.last_block = None
+      self.executor = ThreadPoolExecutor(max_workers=prefetch) if prefetch>0 else None
+
+   def readable(self):
+      return True
+
+   def seekable(self):
+      return True
+
+   def tell(self):
+      return self.position
+
+   def seek(self,offset,whence=io.SEEK_SET):
+      if whence==io.SEEK_SET:
+         position = offset
+      elif whence==io.SEEK_CUR:
+         position = self.position + offset
+      elif whence==io.SEEK_END:
+         position = self.length + offset
+      else:
+         raise ValueError('Invalid whence: {}'.format(whence))
+      if position<0:
+         raise ValueError('Negative seek position {}'.format(position))
+      self.position = position
+      return position
+
+   def _fetch(self,index):
+      offset = index*self.block_size
+      size = min(self.block_size,self.length-offset)
+      data = b''.join(self.client.open(self.path,offset=offset,length=size))
+      if len(data)!=size:
+         raise ServiceError(500,'Short read from {} at {}, {} of {} bytes'.format(self.path,offset,len(data),size))
+      return data
+
+   def _request(self,index):
+      if index in self.blocks:
+         self.blocks.move_to_end(index)
+         return
+      if self.executor is not None:
+         self.blocks[index] = self.executor.submit(self._fetch,index)
+      else:
+         self.blocks[index] = self._fetch(index)
+      while len(self.blocks)>self.cache_blocks:
+         evicted = self.blocks.popitem(last=False)[1]
+         if not isinstance(evicted,bytes):
+            evicted.cancel()
+
+   def _block(self,index):
+      self._request(index)
+      if self.prefetch>0 and self.last_block is not None and index==self.last_block+1:
+         for next_index in range(index+1,min(index+1+self.prefetch,(self.length+self.block_size-1)//self.block_size)):
+            self._request(next_index)
+         self.blocks.move_to_end(index)
+      self.last_block = index
+      block = self.blocks[index]
+      if not isinstance(block,bytes):
+         try:
+            block = block.result()
+         except BaseException:
+            del self.blocks[index]
+            raise
+         self.blocks[index] = block
+      return block
+
+   def readinto(self,buffer):
+      if self.closed:
+         raise ValueError('I/O operation on closed file.')
+      view = memoryview(buffer).cast('B')
+      count = 0
+      while count<len(view) and self.position<self.length:
+         index,start = divmod(self.position,self.block_size)
+         block = self._block(index)
+         size = min(len(block)-start,len(view)-count)
+         view[count:count+size] = block[start:start+size]
+         count += size
+         self.position += size
+      return count
+
+   def close(self):
+      if not self.closed:
+         if self.executor is not None:
+            for block in self.blocks.values():
+               if not isinstance(block,bytes):
+                  block.cancel()
+            self.executor.shutdown(wait=False)
+         self.blocks.clear()
+      super().close()
+
+def local_checksum(filename,algorithm,block_size):
+   """Computes the HDFS MD5-of-MD5-of-CRC checksum of a local file.
+
+   The algorithm is the name reported by GETFILECHECKSUM and the block size is
+   the HDFS block size of the remote file. Returns the MD5 as a hex string.
+   """
+   match = _checksum_algorithm.match(algorithm)
+   if match is None:
+      raise ValueError('Unsupported checksum algorithm: {}'.format(algorithm))
+   bytes_per_crc = int(match.group(2))
+   if match.group(3)=='CRC32C':
+      try:
+         from crc32c import crc32c as crc
+      except ImportError:
+         raise ValueError('The crc32c module is required for {} checksums'.format(algorithm))
+   else:
+      crc = zlib.crc32
+   file_md5 = md5()
+   with open(filename,'rb') as input:
+      while True:
+         block = input.read(block_size)
+         if not block:
+            break
+         crcs = bytearray()
+         for offset in range(0,len(block),bytes_per_crc):
+            crcs += (crc(block[offset:offset+bytes_per_crc]) & 0xffffffff).to_bytes(4,'big')
+         file_md5.update(md5(crcs).digest())
+   return file_md5.hexdigest()
+
 class WebHDFS(Client):
 
    def __init__(self,**kwargs):
       super().__init__(**kwargs)
       self.service = 'webhdfs'
       self.read_chunk_size = 65536
+      self.metadata_cache = kwargs.get('metadata_cache')
+      # send data with the CREATE/APPEND request (e.g., for HttpFS) instead of following a redirect
+      self.direct_data = kwargs.get('direct_data',False)
+      # seconds that a datanode location is reused for reads of the same file (0 disables)
+      self.location_ttl = kwargs.get('location_ttl',60)
+      self.locations = {}
+      self.locations_lock = Lock()
+
+   def _remember_location(self,path,location,offset,length):
+      # only locations that carry the range as plain parameters can be reused
+      parts = urlsplit(location)
+      query = parse_qsl(parts.query,keep_blank_values=True)
+      if offset is not None and ('offset',str(offset)) not in query:
+         return
+      if length is not None and ('length',str(length)) not in query:
+         return
+      query = [(name,value) for name,value in query if name not in ('offset','length')]
+      with self.locations_lock:
+         self.locations[path] = (monotonic()+self.location_ttl,parts,query)
+
+   def _cached_location(self,path,offset,length):
+      with self.locations_lock:
+         entry = self.locations.get(path)
+         if entry is None:
+            return None
+         if entry[0]<=monotonic():
+            del self.locations[path]
+            return None
+      expires,parts,query = entry
+      query = list(query)
+      if offset is not None:
+         query.append(('offset',str(offset)))
+      if length is not None:
+         query.append(('length',str(length)))
+      return urlunsplit((parts.scheme,parts.netloc,parts.path,urlencode(query),parts.fragment))
+
+   def _forget_location(self,path):
+      with self.locations_lock:
+         self.locations.pop(path,None)
+
+   def _cache_path(self,path):
+      path = absolute_path(path)
+      return path[0:-1] if len(path)>1 and path[-1]=='/' else path
+
+   def _invalidate(self,path,recursive=False,ancestors=False):
+      if self.metadata_cache is not None:
+         self.metadata_cache.invalidate(self._cache_path(path),recursive=recursive,ancestors=ancestors)
 
    def list_directory(self,path):
+      """Returns a DirectoryListing of a directory (or of a file)."""
+      if self.metadata_cache is None:
+         return DirectoryListing(self.iter_directory(path))
+      key = self._cache_path(path)
+      listing = self.metadata_cache.get('list',key)
+      if listing is None:
+         listing = DirectoryListing(self.iter_directory(path))
+         self.metadata_cache.put('list',key,listing)
+      return listing
+
+   def _stream_statuses(self,req,parser):
+      # parses the FileStatus objects of a streamed listing as the response arrives
+      decoder = codecs.getincrementaldecoder(req.encoding if req.encoding is not None else 'utf-8')()
+      try:
+         for chunk in req.iter_content(chunk_size=self.read_chunk_size):
+            for entry in parser.feed(decoder.decode(chunk)):
+               yield FileStatus.from_json(entry)
+         for entry in parser.feed(decoder.decode(b'',final=True)):
+            yield FileStatus.from_json(entry)
+      finally:
+         req.close()
+
+   def iter_directory(self,path,batch=True):
+      """Lazily yields the FileStatus of each entry of a directory (or of a file).
+
+      The directory is listed in pages with LISTSTATUS_BATCH and each page is
+      parsed incrementally, so memory use does not depend on the size of the
+      directory. When batch listings are not available, a single LISTSTATUS
+      response is streamed instead.
+      """
       path = absolute_path(path)
       url = '{}{}'.format(self.service_url(),path)
-      req = self.get(url,params={'op':'LISTSTATUS'},allow_redirects=False)
-      #print(req.url)
-      #req = requests.get(url,auth=None)
-      if req.status_code==200:
-         data = req.json()
-         result = {}
-         for entry in data['FileStatuses']['FileStatus']:
-            result[entry['pathSuffix']] = entry
-         return result
-      else:
+      start_after = None
+      while batch:
+         params = {'op':'LISTSTATUS_BATCH'}
+         if start_after is not None:
+            params['startAfter'] = start_after
+         req = self.get(url,params=params,allow_redirects=False,stream=True)
+         if req.status_code!=200:
+            if start_after is None and req.status_code!=404:
+               # not a directory or batch listings are not supported
+               req.close()
+               break
+            raise ServiceError(req.status_code,'Cannot access path {}'.format(path),req)
+         last = None
+         parser = JSONArrayParser('FileStatus')
+         for entry in self._stream_statuses(req,parser):
+            last = entry.name
+            yield entry
+         remaining = re.search(r'"remainingEntries"\s*:\s*(\d+)',parser.tail)
+         if last is None or (remaining is not None and int(remaining.group(1))==0):
+            return
+         start_after = last
+      req = self.get(url,params={'op':'LISTSTATUS'},allow_redirects=False,stream=True)
+      if req.status_code!=200:
          raise ServiceError(req.status_code,'Cannot access path {}'.format(path),req)
+      for entry in self._stream_statuses(req,JSONArrayParser('FileStatus')):
+         yield entry
+
+   def glob(self,pattern,workers=8):
+      """Expands a path with glob patterns (*, ? and [...]) in any of its
+      components and returns the matching paths, sorted.
+
+      The directories at each level with a pattern are listed concurrently. A
+      path without patterns is returned as is, whether it exists or not.
+      """
+      pattern = absolute_path(pattern)
+      if not has_magic(pattern):
+         return [pattern]
+      components = [component for component in pattern.split('/') if component!='']
+      candidates = ['/']
+      with ThreadPoolExecutor(max_workers=workers) as executor:
+         def listing(path):
+            try:
+               return path,self.list_directory(path)
+            except ServiceError as err:
+               if err.status_code==404:
+                  return path,{}
+               raise
+         def exists(path):
+            try:
+               self.status(path)
+               return path,True
+            except ServiceError as err:
+               if err.status_code==404:
+                  return path,False
+               raise
+         verify = False
+         for position,component in enumerate(components):
+            last = position==len(components)-1
+            if not has_magic(component):
+               candidates = [join_path(path,component) for path in candidates]
+               verify = True
+               continue
+            matches = []
+            for path,entries in executor.map(listing,candidates):
+               for i in range(len(entries)):
+                  name = entries.names[i]
+                  if name!='' and fnmatch(name,component) and (last or entries.is_directory(i)):
+                     matches.append(join_path(path,name))
+            candidates = matches
+            verify = False
+         if verify:
+            # the trailing literal components have not been checked
+            candidates = [path for path,found in executor.map(exists,candidates) if found]
+      return sorted(candidates)
+
+   def _walk_listings(self,path,max_depth=None,workers=8,onerror=None):
+      # yields (dirpath,listing,dirnames) as the listings arrive; the caller may
+      # remove names from dirnames before the subdirectories are queued
+      path = absolute_path(path)
+      if len(path)>1 and path[-1]=='/':
+         path = path[0:-1]
+      with ThreadPoolExecutor(max_workers=workers) as executor:
+         directories = deque([(path,1)])
+         pending = {}
+         while len(directories)>0 or len(pending)>0:
+            while len(directories)>0 and len(pending)<workers*2:
+               dirpath,depth = directories.popleft()
+               pending[executor.submit(self.list_directory,dirpath)] = (dirpath,depth)
+            done,not_done = wait(pending,return_when=FIRST_COMPLETED)
+            for future in done:
+               dirpath,depth = pending.pop(future)
+               try:
+                  listing = future.result().sort()
+               except ServiceError as err:
+                  if onerror is None:
+                     raise
+                  onerror(err)
+                  continue
+               dirnames = [listing.names[i] for i in range(len(listing)) if listing.is_directory(i) and listing.names[i]!='']
+               yield dirpath,listing,dirnames
+               if max_depth is None or depth<max_depth:
+                  for name in dirnames:
+                     directories.append((join_path(dirpath,name),depth+1))
+
+   def walk(self,path,max_depth=None,workers=8,onerror=None):
+      """Walks a directory tree, listing subdirectories concurrently.
+
+      Like os.walk, yields a (dirpath,dirnames,files) tuple for every directory,
+      where files maps names to their status. The directories are listed by a
+      bounded pool of workers and yielded as their listings arrive; removing names
+      from dirnames prunes them from the walk. A failed listing is passed to
+      onerror, if given, or raised.
+      """
+      for dirpath,listing,dirnames in self._walk_listings(path,max_depth=max_depth,workers=workers,onerror=onerror):
+         files = {}
+         for i in range(len(listing)):
+            if listing.names[i]=='' or not listing.is_directory(i):
+               files[listing.names[i]] = listing.status(i)
+         yield dirpath,dirnames,files
+
+   def iter_tree(self,path,max_depth=None,include=None,prune=None,workers=8,onerror=None):
+      """Yields a (path,status) tuple for every file and directory below a path.
+
+      The include and prune arguments are either a glob on the entry name or a
+      predicate on (path,status); include selects the entries yielded and prune
+      removes directories (and everything below them) from the walk.
+      """
+      include = path_matcher(include)
+      prune = path_matcher(prune)
+      for dirpath,listing,dirnames in self._walk_listings(path,max_depth=max_depth,workers=workers,onerror=onerror):
+         pruned = set()
+         for i in range(len(listing)):
+            name = listing.names[i]
+            entry_path = join_path(dirpath,name)
+            status = listing.status(i)
+            if prune is not None and name!='' and listing.is_directory(i) and prune(entry_path,status):
+               pruned.add(name)
+               continue
+            if include is None or include(entry_path,status):
+               yield entry_path,status
+         if len(pruned)>0:
+            dirnames[:] = [name for name in dirnames if name not in pruned]
 
    def open(self,path,offset=None,length=None,buffersize=None):
       path = absolute_path(path)
+      if self.location_ttl>0 and buffersize is None:
+         location = self._cached_location(path,offset,length)
+         if location is not None:
+            try:
+               read_req = self.get(location,allow_redirects=False,stream=True)
+               if read_req.status_code==200:
+                  return read_req.iter_content(chunk_size=self.read_chunk_size)
+               read_req.close()
+            except IOError:
+               pass
+            # the location is no longer valid, ask the namenode again
+            self._forget_location(path)
       url = '{}{}?op=OPEN'.format(self.service_url(),path)
       if offset is not None:
          url += '&offset={}'.format(offset)
@@ -38,64 +897,312 @@ class WebHDFS(Client):
       if buffersize is not None:
          url += '&buffersize={}'.format(buffersize)
       #print(url)
-      #open_req = self.get(url)
-      #if open_req.status_code==200:
-      #   return open_req.iter_content(chunk_size=self.read_chunk_size)
-      open_req = self.get(url,allow_redirects=False)
-      if open_req.status_code==307:
+      open_req = self.get(url,allow_redirects=False,stream=True)
+      if open_req.status_code==200:
+         # the service sent the data without a redirect (e.g., HttpFS)
+         return open_req.iter_content(chunk_size=self.read_chunk_size)
+      elif open_req.status_code==307:
          location = open_req.headers['Location'];
+         # reading the (empty) body returns the connection to the pool
+         open_req.content
+         if self.location_ttl>0 and buffersize is None:
+            self._remember_location(path,location,offset,length)
          read_req = self.get(location,allow_redirects=False,stream=True)
          if read_req.status_code==200:
             return read_req.iter_content(chunk_size=self.read_chunk_size)
          else:
+            self._forget_location(path)
             raise ServiceError(read_req.status_code,'Cannot open datanode location {}'.format(location),read_req)
       else:
          raise ServiceError(open_req.status_code,'Cannot open path {}'.format(path),open_req)
 
+   def open_file(self,path,block_size=4194304,cache_blocks=16,prefetch=2,buffered=True):
+      """Opens a file for random access reads (see WebHDFSReader).
+
+      Returns an io.BufferedReader unless buffered is False, in which case the
+      raw reader is returned.
+      """
+      reader = WebHDFSReader(self,absolute_path(path),block_size=block_size,cache_blocks=cache_blocks,prefetch=prefetch)
+      return io.BufferedReader(reader,buffer_size=65536) if buffered else reader
+
+   def read_range(self,path,offset,length):
+      """Returns the bytes of a range of a file."""
+      return b''.join(self.open(path,offset=offset,length=length))
+
+   def head(self,path,lines=10,window=65536):
+      """Returns the first lines of a file as bytes (with their line endings).
+
+      The file is read in ranges that start at the window size and double until
+      enough lines have been found, so only the start of a large file is read.
+      """
+      size = self.status(path)['length']
+      data = bytearray()
+      while len(data)<size:
+         length = min(window,size-len(data))
+         data += self.read_range(path,len(data),length)
+         end = _head_end(data,lines)
+         if end>=0:
+            return bytes(data[0:end])
+         window *= 2
+      return bytes(data)
+
+   def tail(self,path,lines=10,window=65536,length=None):
+      """Returns the last lines of a file as bytes (with their line endings).
+
+      The file is read backwards from its end (or from length, when given) in
+      ranges that start at the window size and double until enough lines have
+      been found, so only the end of a large file is read.
+      """
+      end = self.status(path)['length'] if length is None else length
+      parts = []
+      data = b''
+      while end>0:
+         size = min(window,end)
+         end -= size
+         parts.insert(0,self.read_range(path,end,size))
+         data = b''.join(parts)
+         start = _tail_start(data,lines)
+         if start>=0:
+            return data[start:]
+         window *= 2
+      return data
+
+   def follow(self,path,offset=None,interval=1.0):
+      """Yields the data appended to a file as it grows.
+
+      The length of the file is polled every interval seconds from offset (the
+      current length by default) and only the new bytes are read. A file that
+      becomes shorter (e.g., truncated or replaced) is followed from its start.
+      """
+      while True:
+         self._invalidate(path)
+         size = self.status(path)['length']
+         if offset is None:
+            offset = size
+         if size<offset:
+            offset = 0
+         if size>offset:
+            for chunk in self.open(path,offset=offset,length=size-offset):
+               offset += len(chunk)
+               yield chunk
+         else:
+            sleep(interval)
+
+   def download(self,path,destination,chunk_size=8388608,workers=4,resume=False,verify=False,progress=None):
+      """Downloads a file by fetching disjoint ranges concurrently.
+
+      Each range is written in place into a preallocated destination file. The
+      completed ranges are recorded in a journal next to the destination so that
+      an interrupted download can be resumed. The progress function, if any, is
+      called with the offset and length of every completed range.
+      """
+      info = self.status(path)
+      length = info['length']
+      journal = destination + '.download'
+      header = '{} {} {}\n'.format(length,chunk_size,info['modificationTime'])
+      chunks = [(offset,min(chunk_size,length-offset)) for offset in range(0,length,chunk_size)]
+
+      completed = set()
+      if resume and os.path.exists(journal):
+         with open(journal) as previous:
+            if previous.readline()==header:
+               completed = set(int(line) for line in previous if line.strip()!='')
+      elif resume and os.path.exists(destination):
+         # a partial file from a sequential download
+         size = os.path.getsize(destination)
+         completed = set(offset for offset,size_of in chunks if offset+size_of<=size)
+
+      fd = os.open(destination,os.O_RDWR|os.O_CREAT,0o666)
+      try:
+         os.ftruncate(fd,length)
+         with open(journal,'w') as log:
+            log.write(header)
+            for offset in sorted(completed):
+               log.write('{}\n'.format(offset))
+            log.flush()
+
+            def fetch(offset,size):
+               position = offset
+               for data in self.open(path,offset=offset,length=size):
+                  os.pwrite(fd,data,position)
+                  position += len(data)
+               if position-offset!=size:
+                  raise ServiceError(500,'Short read from {} at {}, {} of {} bytes'.format(path,offset,position-offset,size))
+               return offset,size
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+               futures = [executor.submit(fetch,offset,size) for offset,size in chunks if offset not in completed]
+               for future in as_completed(futures):
+                  offset,size = future.result()
+                  log.write('{}\n'.format(offset))
+                  log.flush()
+                  if progress is not None:
+                     progress(offset,size)
+      finally:
+         os.close(fd)
+      os.remove(journal)
+
+      if verify:
+         remote = self.checksum(path)
+         expected = remote['bytes'][-32:]
+         actual = local_checksum(destination,remote['algorithm'],info['blockSize'])
+         if actual!=expected:
+            raise ValueError('Checksum mismatch for {}: {} != {}'.format(destination,actual,expected))
+      return info
+
    def make_directory(self,path,permission=None):
       path = absolute_path(path)
+      if self.metadata_cache is not None and permission is None:
+         info = self.metadata_cache.get('status',self._cache_path(path))
+         if isinstance(info,dict) and info.get('type')=='DIRECTORY':
+            return True
       url = '{}{}?op=MKDIRS'.format(self.service_url(),path)
       if permission is not None:
          url += '&permission={}'.format(permission)
       #print(url)
       req = self.put(url)
+      self._invalidate(path,ancestors=True)
       if req.status_code!=200:
          raise ServiceError(req.status_code,'Cannot create path {}'.format(path),req)
       msg = req.json()
       return msg['boolean']
 
-   def move(self,sourcepath,destpath):
+   def move(self,sourcepath,destpath,overwrite=False):
       sourcepath = absolute_path(sourcepath)
       destpath = absolute_path(destpath)
       url = '{}{}?op=RENAME&destination={}'.format(self.service_url(),sourcepath,destpath)
+      if overwrite:
+         url += '&renameoptions=OVERWRITE'
       #print(url)
       req = self.put(url)
+      self._invalidate(sourcepath,recursive=True)
+      self._invalidate(destpath,recursive=True)
       if req.status_code!=200:
          raise ServiceError(req.status_code,'Cannot move path {} to {}'.format(sourcepath,destpath),req)
+      if overwrite:
+         # a rename with options has no result
+         return True
       msg = req.json()
       return msg['boolean']
 
+   def concat(self,path,sources):
+      """Appends the sources (in order) to a file and removes them."""
+      path = absolute_path(path)
+      sources = [absolute_path(source) for source in sources]
+      url = '{}{}'.format(self.service_url(),path)
+      req = self.post(url,params={'op':'CONCAT','sources':','.join(sources)})
+      self._invalidate(path)
+      for source in sources:
+         self._invalidate(source)
+      if req.status_code!=200:
+         raise ServiceError(req.status_code,'Cannot concatenate to path {}'.format(path),req)
+      return True
+
    def remove(self,path,recursive=False):
       path = absolute_path(path)
       recursiveParam = 'true' if recursive else 'false'
       url = '{}{}?op=DELETE&recursive={}'.format(self.service_url(),path,recursiveParam)
       #print(url)
       req = self.delete(url)
+      self._invalidate(path,recursive=True)
       if req.status_code!=200:
          raise ServiceError(req.status_code,'Cannot delete path {}'.format(path),req)
       msg = req.json()
       return msg['boolean']
 
    def status(self,path):
+      if self.metadata_cache is not None:
+         key = self._cache_path(path)
+         info = self.metadata_cache.get('status',key)
+         if isinstance(info,_NotFound):
+            # a new error every time as a raised error accumulates its traceback
+            raise ServiceError(404,'Cannot status path {}'.format(path),info.request)
+         if info is not None:
+            return info
       url = '{}{}?op=GETFILESTATUS'.format(self.service_url(),absolute_path(path))
       #print(url)
       req = self.get(url)
       if req.status_code!=200:
-         raise ServiceError(req.status_code,'Cannot status path {}'.format(path),req)
+         err = ServiceError(req.status_code,'Cannot status path {}'.format(path),req)
+         if self.metadata_cache is not None and req.status_code==404:
+            self.metadata_cache.put('status',key,_NotFound(req))
+         raise err
       msg = req.json()
+      if self.metadata_cache is not None:
+         self.metadata_cache.put('status',key,msg['FileStatus'])
       return msg['FileStatus']
 
-   def copy(self,data,path,size=-1,overwrite=False):
+   def content_summary(self,path):
+      """Returns the content summary of a path: the length, fileCount,
+      directoryCount, spaceConsumed, quota, spaceQuota and typeQuota."""
+      url = '{}{}'.format(self.service_url(),absolute_path(path))
+      req = self.get(url,params={'op':'GETCONTENTSUMMARY'})
+      if req.status_code!=200:
+         raise ServiceError(req.status_code,'Cannot get the content summary of path {}'.format(path),req)
+      msg = req.json()
+      return msg['ContentSummary']
+
+   def content_summaries(self,paths,workers=8):
+      """Gets the content summaries of paths concurrently, yielding (path,summary,error)
+      tuples as they complete, where error is the ServiceError of a failed request."""
+      def summary(path):
+         try:
+            return (path,self.content_summary(path),None)
+         except ServiceError as err:
+            return (path,None,err)
+      with ThreadPoolExecutor(max_workers=workers) as executor:
+         for future in as_completed([executor.submit(summary,path) for path in paths]):
+            yield future.result()
+
+   def quota(self,path):
+      """Returns the quotas and usage of a path: quota and fileAndDirectoryCount
+      for the namespace, spaceQuota and spaceConsumed for the space, and typeQuota.
+
+      Uses GETQUOTAUSAGE, which avoids counting the files, where it is supported
+      and the content summary otherwise. A quota of -1 is not set.
+      """
+      url = '{}{}'.format(self.service_url(),absolute_path(path))
+      req = self.get(url,params={'op':'GETQUOTAUSAGE'})
+      if req.status_code==200:
+         return req.json()['QuotaUsage']
+      if req.status_code==404:
+         raise ServiceError(req.status_code,'Cannot get the quota of path {}'.format(path),req)
+      summary = self.content_summary(path)
+      return {
+         'fileAndDirectoryCount' : summary['fileCount'] + summary['directoryCount'],
+         'quota' : summary['quota'],
+         'spaceConsumed' : summary['spaceConsumed'],
+         'spaceQuota' : summary['spaceQuota'],
+         'typeQuota' : summary.get('typeQuota',{})
+      }
+
+   def set_times(self,path,modification_time=None,access_time=None):
+      """Sets the modification and/or access time (in milliseconds since the epoch) of a path."""
+      path = absolute_path(path)
+      url = '{}{}'.format(self.service_url(),path)
+      params = {'op':'SETTIMES'}
+      params['modificationtime'] = modification_time if modification_time is not None else -1
+      params['accesstime'] = access_time if access_time is not None else -1
+      req = self.put(url,params=params)
+      self._invalidate(path)
+      if req.status_code!=200:
+         raise ServiceError(req.status_code,'Cannot set the times of path {}'.format(path),req)
+      return True
+
+   def checksum(self,path):
+      url = '{}{}?op=GETFILECHECKSUM'.format(self.service_url(),absolute_path(path))
+      req = self.get(url)
+      if req.status_code!=200:
+         raise ServiceError(req.status_code,'Cannot get checksum of path {}'.format(path),req)
+      msg = req.json()
+      return msg['FileChecksum']
+
+   def copy(self,data,path,size=-1,overwrite=False,block_size=None,progress=None):
+      """Creates a file from bytes, a str, a readable or an iterable.
+
+      Anything but bytes is streamed in blocks of block_size bytes (see
+      UploadStream) and progress(sent,size) is called after each block.
+      """
       path = absolute_path(path)
       overwriteParam = 'true' if overwrite else 'false'
       url = '{}{}?op=CREATE&overwrite={}'.format(self.service_url(),path,overwriteParam)
@@ -104,6 +1211,15 @@ class WebHDFS(Client):
       headers['Content-Type'] = 'application/octet-stream'
       if size >= 0:
          headers['Content-Length'] = str(size)
+      if self.direct_data:
+         req = self.put(
+            url + '&data=true',
+            data=upload_body(data,size=size,block_size=block_size,progress=progress),
+            headers=headers)
+         self._invalidate(path,ancestors=True)
+         if req.status_code!=201:
+            raise ServiceError(req.status_code,'Cannot copy to path {}'.format(path),req)
+         return True
       open_req = self.put(
          url,
          allow_redirects=False,
@@ -113,37 +1229,175 @@ class WebHDFS(Client):
          #print(location)
          req = self.put(
             location,
-            data=data,
+            data=upload_body(data,size=size,block_size=block_size,progress=progress),
             headers=headers)
+         self._invalidate(path,ancestors=True)
          if req.status_code!=201:
             raise ServiceError(req.status_code,'Cannot copy to path {}'.format(path),req)
       else:
-         raise ServiceError(req.status_code,'Cannot open path {}'.format(path),open_req)
+         raise ServiceError(open_req.status_code,'Cannot open path {}'.format(path),open_req)
       return True
 
-   def append(self,data,path,size=-1,buffersize=None):
+   def upload(self,source,path,part_size=134217728,workers=4,overwrite=False,retries=3,block_size=None,progress=None):
+      """Uploads a local file in parts of part_size bytes that are sent concurrently.
+
+      The parts are written to hidden files next to the destination, joined with
+      CONCAT and the result is renamed into place, so the destination only
+      appears once the upload is complete. A failed part is retried up to retries
+      times; on failure the parts are removed. Clusters that require full blocks
+      for CONCAT need a part_size that is a multiple of the block size.
+      Small files are copied in a single request.
+      """
       path = absolute_path(path)
-      url = '{}{}?op=APPEND&overwrite={}'.format(self.service_url(),path)
+      size = os.path.getsize(source)
+      if size<=part_size or workers<2:
+         with open(source,'rb') as input:
+            return self.copy(input,path,size=size,overwrite=overwrite,block_size=block_size,progress=progress)
+      if not overwrite:
+         exists = True
+         try:
+            self.status(path)
+         except ServiceError as err:
+            if err.status_code!=404:
+               raise
+            exists = False
+         if exists:
+            raise ServiceError(403,'Cannot upload to path {}, it exists'.format(path))
+
+      slash = path.rfind('/')
+      prefix = '{}/.{}.{}'.format(path[0:slash],path[slash+1:],uuid4().hex)
+      parts = ['{}.part{:05d}'.format(prefix,index) for index in range((size+part_size-1)//part_size)]
+      sent = [0]*len(parts)
+      lock = Lock()
+
+      def upload_part(index):
+         offset = index*part_size
+         length = min(part_size,size-offset)
+         def part_progress(part_sent,part_size):
+            with lock:
+               sent[index] = part_sent
+               total = sum(sent)
+            if progress is not None:
+               progress(total,size)
+         for attempt in range(retries+1):
+            try:
+               with open(source,'rb') as input:
+                  input.seek(offset)
+                  return self.copy(input,parts[index],size=length,overwrite=True,block_size=block_size,progress=part_progress)
+            except (ServiceError,IOError):
+               if attempt==retries:
+                  raise
+               with lock:
+                  sent[index] = 0
+
+      try:
+         with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(upload_part,index) for index in range(len(parts))]
+            try:
+               for future in as_completed(futures):
+                  future.result()
+            except BaseException:
+               for future in futures:
+                  future.cancel()
+               raise
+         # long source lists are concatenated in batches to limit the URL length
+         for start in range(1,len(parts),64):
+            self.concat(parts[0],parts[start:start+64])
+         if not self.move(parts[0],path,overwrite=overwrite):
+            raise ServiceError(403,'Cannot move {} to {}'.format(parts[0],path))
+      except BaseException:
+         for part in parts:
+            try:
+               self.remove(part)
+            except (ServiceError,IOError):
+               pass
+         raise
+      return True
+
+   def resumable_upload(self,source,path,checkpoint_size=134217728,journal=None,overwrite=False,block_size=None,progress=None):
+      """Uploads a local file with a CREATE followed by APPENDs of checkpoint_size bytes.
+
+      Every completed request is recorded in a journal (by default next to the
+      source). When a journal for the same local file and destination exists,
+      the upload continues from the length of the remote file so that no bytes
+      are sent twice. The journal is removed once the upload completes.
+      """
+      path = absolute_path(path)
+      info = os.stat(source)
+      size = info.st_size
+      journal = journal if journal is not None else source + '.upload'
+      header = '{} {} {}\n'.format(size,info.st_mtime_ns,path)
+
+      offset = None
+      if os.path.exists(journal):
+         with open(journal) as previous:
+            if previous.readline()==header:
+               offset = 0
+      if offset is not None:
+         try:
+            # the remote length includes any data appended after the last checkpoint
+            offset = self.status(path)['length']
+         except ServiceError as err:
+            if err.status_code!=404:
+               raise
+            offset = None
+      if offset is not None and offset>size:
+         raise ServiceError(409,'Remote file {} is longer ({}) than {} ({})'.format(path,offset,source,size))
+
+      with open(source,'rb') as input, open(journal,'w' if offset is None else 'a') as log:
+         def send(start,length,operation,**kwargs):
+            input.seek(start)
+            operation(
+               input,
+               path,
+               size=length,
+               block_size=block_size,
+               progress=(lambda sent,total : progress(start+sent,size)) if progress is not None else None,
+               **kwargs)
+            log.write('{}\n'.format(start+length))
+            log.flush()
+            return start+length
+         if offset is None:
+            log.write(header)
+            offset = send(0,min(checkpoint_size,size),self.copy,overwrite=overwrite)
+         while offset<size:
+            offset = send(offset,min(checkpoint_size,size-offset),self.append)
+      os.remove(journal)
+      return True
+
+   def append(self,data,path,size=-1,buffersize=None,block_size=None,progress=None):
+      path = absolute_path(path)
+      url = '{}{}?op=APPEND'.format(self.service_url(),path)
       if buffersize is not None:
          url += '&buffersize={}'.format(buffersize)
       #print(url)
+      headers = {}
+      headers['Content-Type'] = 'application/octet-stream'
+      if size >= 0:
+         headers['Content-Length'] = str(size)
+      if self.direct_data:
+         req = self.post(
+            url + '&data=true',
+            data=upload_body(data,size=size,block_size=block_size,progress=progress),
+            headers=headers)
+         self._invalidate(path,ancestors=True)
+         if req.status_code!=200:
+            raise ServiceError(req.status_code,'Cannot append to path {}'.format(path),req)
+         return True
       open_req = self.post(
          url,
          allow_redirects=False,
          headers={'Content-Length' : '0'})
       if open_req.status_code==307:
-         headers = {}
-         headers['Content-Type'] = 'application/octet-stream'
-         if size >= 0:
-            headers['Content-Length'] = str(size)
          location = open_req.headers['Location'];
          #print(location)
          req = self.post(
             location,
-            data=data,
+            data=upload_body(data,size=size,block_size=block_size,progress=progress),
             headers=headers)
+         self._invalidate(path,ancestors=True)
          if req.status_code!=200:
             raise ServiceError(req.status_code,'Cannot append to path {}'.format(path),req)
       else:
-         raise ServiceError(req.status_code,'Cannot append path {}'.format(path),open_req)
+         raise ServiceError(open_req.status_code,'Cannot append path {}'.format(path),open_req)
       return True
@@ -76,7 +76,7 @@ setup(
 
     # You can just specify the packages manually here if your project is
     # simple. Or you can use find_packages().
-    packages=['pyox','pyox.apps.monitor', 'pyox.apps.tracker'],
+    packages=['pyox','pyox.aio','pyox.apps.monitor', 'pyox.apps.tracker'],
     #find_packages(exclude=['contrib', 'docs', 'tests', 'virtualenv']),
 
     # Alternatively, if you want to distribute just a my_module.py, uncomment
@@ -94,6 +94,8 @@ setup(
     # for example:
     # $ pip install -e .[dev,test]
     extras_require={
+        'aio': ['httpx'],
+        'compression': ['zstandard','lz4'],
     },
 
     include_package_data=True,